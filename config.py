@@ -5,21 +5,76 @@
 SCREEN_WIDTH = 800
 SCREEN_HEIGHT = 700
 HUD_HEIGHT = 100
+DIALOGUE_HEIGHT = 100 # Space kept free at the bottom for the dialogue box
 GRID_SIZE = 20
+VIEW_WIDTH = SCREEN_WIDTH // GRID_SIZE # Maze cells visible at once; larger mazes scroll with the player
+VIEW_HEIGHT = (SCREEN_HEIGHT - HUD_HEIGHT - DIALOGUE_HEIGHT) // GRID_SIZE
+CAMERA_MARGIN = 5 # The view only scrolls once the player gets this many cells from its edge
+RENDER_BLOCK_SIZE = 32 # Maze cells per side of each pre-rendered background block
+RENDER_BLOCK_CACHE = 64 # Background blocks kept rendered before the least recently used are dropped
 
 # Maze settings
 MIN_HALLWAY_SIZE = 1
 MAX_HALLWAY_SIZE = 2
 MAZE_WIDTH = SCREEN_WIDTH // GRID_SIZE
-MAZE_HEIGHT = (SCREEN_HEIGHT - 100- HUD_HEIGHT) // GRID_SIZE  # Leaving space for dialogue box
+MAZE_HEIGHT = (SCREEN_HEIGHT - DIALOGUE_HEIGHT - HUD_HEIGHT) // GRID_SIZE  # Leaving space for dialogue box
 MAZE_SEED = -1 # Set to -1 for random seed
 
+# Chunked world settings
+CHUNKED_WORLD = False # Generate an unbounded maze lazily, chunk by chunk
+CHUNK_SIZE = 32 # Cells per chunk side, must be even
+CHUNK_CACHE_MB = 64 # Memory budget for cached chunks before the least recently used are dropped
+
+# Level cache settings
+LEVEL_CACHE_DIR = 'level_cache' # Generated levels are stored here, keyed by MAZE_SEED
+
 # Colors
 BLACK = (0, 0, 0)
 WHITE = (255, 255, 255)
 
+# Simulation settings
+SIM_TICK_MS = 16 # Simulated time per tick, headless or in the game loop
+HUNGER_DECAY_INTERVAL = 0 # ms between passive hunger/thirst decay ticks, 0 disables
+
+# Frame pacing settings
+MAX_FPS = 60 # Render rate cap while the player is active
+IDLE_FPS = 10 # Render rate cap once there has been no input for IDLE_AFTER_MS
+IDLE_AFTER_MS = 2000
+MAX_CATCH_UP_TICKS = 10 # Most simulation steps run in one frame after a stall
+TEXT_CACHE_SIZE = 256 # Rendered text surfaces kept for the HUD, dialogue and inventory
+
 #NPC settings
 # ------------------------------------
+NPC_SIGHT_RANGE = 5 # Cells along a row or column that aggressive NPCs can see
+NPC_PURSUIT_RANGE = 5 # Walking distance at which aggressive NPCs start chasing the player
+SPATIAL_CELL_SIZE = 8 # Side, in maze cells, of a spatial index bucket for NPC proximity queries
+FLOW_FIELD_RADIUS = 32 # Steps around the player covered by the shared pursuit field, None covers the whole maze
+NUM_CROWD_NPCS = 0 # Extra wandering NPCs kept in the array-backed population store
+
+# LLM settings
+LLM_BACKEND = 'hf' # 'hf' for a Hugging Face model, 'stub' for instant canned replies (tests, offline play)
+LLM_MODEL_NAME = 'mlabonne/Meta-Llama-3.1-8B-Instruct-abliterated' # Loaded on the first NPC chat
+LLM_DEVICE = 'auto' # 'auto' picks cuda, then mps, then cpu
+LLM_MAX_LENGTH = 1024 # Prompt tokens kept after truncation
+LLM_MAX_NEW_TOKENS = 150
+LLM_TEMPERATURE = 0.7
+DIALOGUE_WORKERS = 4 # Threads generating NPC replies in the background
+LLM_BATCHING = True # Queue prompts from all NPCs and run them through the model in batches
+LLM_BATCH_WINDOW_MS = 20 # How long the queue waits for more prompts before running a batch
+LLM_MAX_BATCH = 8 # Most prompts run in one batch
+LLM_PREFIX_CACHE_SIZE = 16 # NPC personas whose key/values stay cached between turns
+LLM_PREFIX_CACHE_IDLE_S = 300 # Cached personas unused for this many seconds are dropped
+LLM_PROMPT_TOKEN_BUDGET = 768 # Prompt tokens NPC prompts are kept under, history included
+MEMORY_RECENT_TURNS = 4 # Conversation turns each NPC remembers word for word
+MEMORY_SUMMARY_TOKENS = 128 # Size of the rolling summary older turns are folded into
+MEMORY_SUMMARY_LINE_WORDS = 12 # Words kept of each line folded into the summary
+LLM_STREAMING = True # Show NPC replies in the dialogue box as they are generated
+LLM_STREAM_DELAY_MS = 30 # Pause between words streamed by the stub backend
+RESPONSE_CACHE_SIZE = 512 # NPC replies remembered for repeated player lines (0 disables the cache)
+RESPONSE_CACHE_PATH = 'response_cache.json' # Keeps the cache between sessions; None keeps it in memory only
+RESPONSE_CACHE_HISTORY = 2 # Most recent history lines that are part of the cache key
+RESPONSE_CACHE_VARIETY = 0.0 # Chance a cached line is regenerated anyway, adding another variant
+RESPONSE_CACHE_VARIANTS = 3 # Replies kept per cached line
 
 ## Item settings
 # ------------------------------------
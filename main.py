@@ -1,11 +1,15 @@
 import pygame
 import random
-from config import SCREEN_WIDTH, SCREEN_HEIGHT, BLACK, WHITE, NUM_FOOD, NUM_DRINKS, NUM_TOOLS 
-from utils.maze_utils import Maze
-from utils.pc_utils import PlayerCharacter
-from utils.npc_utils import StaticNPC, RandomNPC, AggressiveNPC
-from utils.dialogue_utils import draw_dialogue_box, player_near_npc, handle_npc_response
-from utils.item_utils import item_registry, ENTITY_IDS
+from config import SCREEN_WIDTH, SCREEN_HEIGHT, BLACK, WHITE, NUM_FOOD, NUM_DRINKS, NUM_TOOLS, CHUNKED_WORLD
+from utils.chunk_utils import ChunkedMaze
+from utils.level_utils import load_or_generate_level, SPAWN_KINDS
+from utils.sim_utils import SimClock, MOVES, build_simulation
+from utils.loop_utils import FrameScheduler
+from utils.text_utils import get_font, render_text
+from utils.display_utils import DirtyRects, camera
+from utils.dialogue_utils import draw_dialogue_box, handle_npc_response, DialogueService
+from utils.item_utils import item_registry
+from utils.cache_utils import get_response_cache
 
 # Initialize pygame
 pygame.init()
@@ -14,11 +18,6 @@ pygame.font.init()
 # Create the screen
 screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
 
-# Initialize and generate the maze
-maze = Maze()
-maze.generate()
-maze.place_items(NUM_FOOD, NUM_DRINKS, NUM_TOOLS)
-
 # Find open spaces for player and NPC placemen
 # # Helper function to get a random open space
 def get_random_open_space():
@@ -26,46 +25,57 @@ def get_random_open_space():
     open_spaces.remove(space)  # Remove the chosen space to prevent reuse
     return space
 
+# Initialize and generate the maze, or load it from the level cache
+if CHUNKED_WORLD:
+    maze = ChunkedMaze()
+    maze.generate()
+    maze.place_items(NUM_FOOD, NUM_DRINKS, NUM_TOOLS)
+    open_spaces = maze.find_open_spaces()
+    spawns = {kind: get_random_open_space() for kind in SPAWN_KINDS}
+else:
+    maze, spawns = load_or_generate_level()
+
 def draw_inventory(screen, font, player):
-    """Draw the inventory over the game screen."""
+    """Draw the inventory over the game screen, returning its rect."""
     # Inventory background
-    pygame.draw.rect(screen, (200, 200, 200), pygame.Rect(100, 100, SCREEN_WIDTH - 200, SCREEN_HEIGHT - 200))
+    inventory_rect = pygame.Rect(100, 100, SCREEN_WIDTH - 200, SCREEN_HEIGHT - 200)
+    pygame.draw.rect(screen, (200, 200, 200), inventory_rect)
     
     # Inventory items
     inventory = player.get_inventory()
     for index, (item, quantity) in enumerate(inventory):
         color = (255, 0, 0) if index == player.selected_item_index else (0, 0, 0)
         item_text = f"{quantity}x {item}"
-        text_surface = font.render(item_text, True, color)
+        text_surface = render_text(font, item_text, color)
         screen.blit(text_surface, (150, 150 + index * 40))
     
     # Instruction to exit
-    exit_text = font.render("Press 'Esc' to exit", True, (0, 0, 0))
+    exit_text = render_text(font, "Press 'Esc' to exit", (0, 0, 0))
     screen.blit(exit_text, (150, SCREEN_HEIGHT - 150))
+    return inventory_rect
 
-open_spaces = maze.find_open_spaces()
-
-# Initialize player at a random open space
-player_pos = list(get_random_open_space())  # Use list to modify position later
-
-# Create the player character
-player = PlayerCharacter(start_x=player_pos[0], start_y=player_pos[1])
-
-# Initialize NPCs at random open spaces
-static_npc = StaticNPC(x=0, y=0, image_path='path_to_image')
-static_npc.x, static_npc.y = get_random_open_space()
-
-random_npc = RandomNPC(x=0, y=0, home_x=0, home_y=0, image_path='path_to_image')
-random_npc.x, random_npc.y = get_random_open_space()
-random_npc.home_x, random_npc.home_y = random_npc.x, random_npc.y
+# Put the player, NPCs and any crowd on their spawn points.
+# Game logic advances in fixed steps on its own clock; rendering and input stay in this loop
+sim = build_simulation(maze, spawns, clock=SimClock())
+player, npcs, population = sim.player, sim.npcs, sim.population
+frames = FrameScheduler(tick_ms=sim.tick_ms)
 
-aggressive_npc = AggressiveNPC(x=0, y=0, image_path='path_to_image')
-aggressive_npc.x, aggressive_npc.y = get_random_open_space()
+# Only the parts of the screen that changed are sent to the display
+dirty = DirtyRects()
 
-npcs = [static_npc, random_npc, aggressive_npc]
+# The camera follows the player; a bounded maze keeps it from scrolling past the edges
+maze_bounds = (None, None) if CHUNKED_WORLD else (maze.width, maze.height)
     
+# Arrow keys map to the simulation's move actions
+KEY_ACTIONS = {
+    pygame.K_LEFT: 'left',
+    pygame.K_RIGHT: 'right',
+    pygame.K_UP: 'up',
+    pygame.K_DOWN: 'down',
+}
+
 # Font for text rendering
-font = pygame.font.Font(None, 32)
+font = get_font(32)
 
 # Game loop
 running = True
@@ -75,54 +85,83 @@ dialogue_active = False
 inventory_active = False
 input_active = False
 current_npc = None
+dialogue_npc = None  # NPC the player is talking to, fixed for the whole conversation
+pending_reply = None  # DialogueHandle for an NPC reply still being generated
 user_input = ""
 npc_message = ""
 item_message = None  # Track item usage message to display in dialogue box
 item_message = None  # Track item usage message to display in dialogue box
 item_message_active = False  # Track if an item message is active
 
+# NPC replies are generated off the render thread
+dialogue_service = DialogueService()
+
 while running:
-    screen.fill(BLACK)
+    # Sleep until the next frame is due and find out how far the simulation is behind
+    sim_steps = frames.tick()
+
+    # Scrolling moves everything on screen
+    if camera.follow(player.x, player.y, *maze_bounds):
+        dirty.invalidate()
+
+    # Restore the background under everything drawn last frame, or clear the screen after a layout change
+    if dirty.full:
+        screen.fill(BLACK)
+        restore = None
+    else:
+        restore = dirty.previous_rects()
+        for rect in restore:
+            screen.fill(BLACK, rect)
+
+    # Pick up the NPC's reply once it has finished generating, showing it as it streams in
+    if pending_reply and pending_reply.done():
+        npc_message = pending_reply.result() or ""
+        pending_reply = None
+    elif pending_reply:
+        npc_message = pending_reply.partial or "..."
+        frames.wake()  # Keep the full frame rate while the reply streams in
 
     if inventory_active:
         # Draw inventory if it's active
-        draw_inventory(screen, font, player)
+        inventory_rect = draw_inventory(screen, font, player)
+        dirty.track('inventory', inventory_rect, (tuple(player.get_inventory()), player.selected_item_index))
     else:
         # Draw the maze
-        maze.draw(screen)
+        dirty.add(maze.draw(screen, areas=restore))
 
-        # Update and draw NPCs
-        static_npc.draw(screen)
-        random_npc.update(maze)
-        random_npc.draw(screen)
-        aggressive_npc.update(maze, (player.x, player.y))
-        aggressive_npc.draw(screen)
+        # Update and draw NPCs; the simulation is paused while the inventory is open
+        for _ in range(sim_steps):
+            sim.step()
+        for npc in npcs:
+            npc_rect = npc.draw(screen)
+            if npc_rect:
+                dirty.track(id(npc), npc_rect, npc.color)
+        if population is not None:
+            for index, rect in population.draw(screen):
+                dirty.track(('crowd', index), rect)
 
         # Draw the player
-        player.draw(screen)
-        player.draw_hud(screen)
+        dirty.track('player', player.draw(screen), player.color)
+        dirty.track('hud', player.draw_hud(screen), (player.hunger, player.thirst, player.health))
         
     if not inventory_active:  # Disable NPC interaction when inventory is open
-        if player_near_npc((player.x, player.y), static_npc):
-            current_npc = static_npc
-        elif player_near_npc((player.x, player.y), random_npc):
-            current_npc = random_npc
-        elif player_near_npc((player.x, player.y), aggressive_npc):
-            current_npc = aggressive_npc
-        else:
-            current_npc = None
+        nearby_npcs = sim.nearby_npcs(radius=1)
+        current_npc = nearby_npcs[0] if nearby_npcs else None
 
         # If the player is near an NPC, show "Press enter to talk"
         if current_npc and not dialogue_active and not item_message_active:
-            text_surface = font.render("Press Enter to talk", True, WHITE)
-            screen.blit(text_surface, (SCREEN_WIDTH // 2 - 100, SCREEN_HEIGHT - 50))
+            text_surface = render_text(font, "Press Enter to talk", WHITE)
+            dirty.track('talk_prompt', screen.blit(text_surface, (SCREEN_WIDTH // 2 - 100, SCREEN_HEIGHT - 50)))
         
         player_at_item = player.is_item_at_player_position(maze)
 
     # Handle events
     for event in pygame.event.get():
+        frames.wake()
         if event.type == pygame.QUIT:
             running = False
+        elif event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+            dirty.invalidate()  # The window was uncovered; its contents need sending again
 
         if event.type == pygame.KEYDOWN:
             # Close the item message dialogue box when pressing Enter or Esc
@@ -133,9 +172,9 @@ while running:
             # Only allow item use after the item message box has been closed
             elif inventory_active and not item_message_active:
                 if event.key == pygame.K_UP:
-                    player.selected_item_index = (player.selected_item_index - 1) % len(player.get_inventory())
+                    player.select_item(-1)
                 elif event.key == pygame.K_DOWN:
-                    player.selected_item_index = (player.selected_item_index + 1) % len(player.get_inventory())
+                    player.select_item(1)
                 elif event.key == pygame.K_RETURN:
                     # Use the selected item
                     item_message = player.use_item()
@@ -148,28 +187,35 @@ while running:
 
             # Handle movement only when no item message is active and inventory is closed
             elif not dialogue_active and not inventory_active and not item_message_active:
-                player.move(event, maze)
+                if event.key in KEY_ACTIONS:
+                    sim.move_player(*MOVES[KEY_ACTIONS[event.key]])
                 # After moving, update item and NPC status
                 player_at_item = player.is_item_at_player_position(maze)
-                current_npc = player.get_nearby_npc(npcs)
+                nearby_npcs = sim.nearby_npcs(radius=1)
+                current_npc = nearby_npcs[0] if nearby_npcs else None
 
             # Start conversation with NPC (only if inventory is closed)
             if not inventory_active and not item_message_active and event.key == pygame.K_RETURN:
                 if player_at_item:
                     #Player is standing on item
-                    item_message = player.pick_up_item(maze)
+                    item_message = sim.pick_up()
                     item_message_active = True
                     player_at_item = False
                 if current_npc and not dialogue_active:
                     # Activate chat
                     dialogue_active = True
+                    dialogue_npc = current_npc
                     npc_message = "hello"  # NPC says "hello"
                     user_input = ""  # Clear user input
                     input_active = True
                     conversation_counter = 0  # Reset conversation counter
-                elif dialogue_active and input_active:
-                    # NPC responds with player's message or silence
-                    npc_message = handle_npc_response(npc_message, user_input, conversation_counter)
+                elif dialogue_active and input_active and not pending_reply:
+                    if conversation_counter < 10:
+                        # The NPC "thinks" in the background; the reply is picked up at the top of the loop
+                        pending_reply = dialogue_service.request(dialogue_npc, user_input or "(silence)")
+                        npc_message = "..."
+                    else:
+                        npc_message = handle_npc_response(npc_message, user_input, conversation_counter)
                     user_input = ""  # Clear player input
                     conversation_counter += 1  # Increment conversation counter
 
@@ -182,7 +228,11 @@ while running:
 
             # Escape key to exit conversation
             if event.key == pygame.K_ESCAPE and dialogue_active:
+                if pending_reply:
+                    pending_reply.cancel()  # Stop generating a reply nobody will read
+                    pending_reply = None
                 dialogue_active = False  # Exit dialogue mode
+                dialogue_npc = None
                 input_active = False  # Stop collecting input
                 npc_message = ""  # Clear NPC message
                 user_input = ""  # Clear user input
@@ -190,23 +240,30 @@ while running:
             # Open/close inventory
             if event.key == pygame.K_i and not dialogue_active:
                 inventory_active = not inventory_active  # Toggle inventory
+                dirty.invalidate()  # Switching between the maze and the inventory redraws everything
             elif event.key == pygame.K_ESCAPE and inventory_active:
                 inventory_active = False  # Close inventory
+                dirty.invalidate()
 
     # Draw the dialogue box with item message if it exists
     if item_message_active:
-        draw_dialogue_box(screen, font, "", "", item_message)  # Show only item message
+        box_rect = draw_dialogue_box(screen, font, "", "", item_message)  # Show only item message
+        dirty.track('dialogue', box_rect, item_message)
     elif dialogue_active:
-        draw_dialogue_box(screen, font, npc_message, user_input)
+        box_rect = draw_dialogue_box(screen, font, npc_message, user_input)
+        dirty.track('dialogue', box_rect, (npc_message, user_input))
     elif player_at_item:
         #show promopt to pick up item
-        item_id = maze.grid[player.y][player.x]
-        item = ENTITY_IDS[item_id]
+        item_id = maze.item_at(player.x, player.y)
+        item = item_registry[item_id].name
         prompt = f"Press 'Enter' to pick up {item}"
-        draw_dialogue_box(screen, font, "", "", prompt)
+        box_rect = draw_dialogue_box(screen, font, "", "", prompt)
+        dirty.track('dialogue', box_rect, prompt)
     
-    # Update the screen
-    pygame.display.flip()
+    # Update the changed parts of the screen
+    dirty.present()
 
 # Quit the game
+dialogue_service.shutdown()
+get_response_cache().save()  # Keep common exchanges for the next session
 pygame.quit()
\ No newline at end of file
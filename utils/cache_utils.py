@@ -0,0 +1,111 @@
+import json
+import os
+import random
+import re
+import threading
+from collections import OrderedDict
+from config import (RESPONSE_CACHE_SIZE, RESPONSE_CACHE_PATH, RESPONSE_CACHE_HISTORY, RESPONSE_CACHE_VARIETY,
+                    RESPONSE_CACHE_VARIANTS)
+
+def normalize_input(text: str) -> str:
+    """Lowercase player input and strip punctuation and extra whitespace, so "Hello!" and "hello" match."""
+    return ' '.join(re.sub(r"[^\w\s']", ' ', text.lower()).split())
+
+class ResponseCache:
+    """LRU cache of NPC replies keyed by persona, recent history and normalized player input.
+
+    Each key keeps up to `max_variants` replies and a hit returns one of them at
+    random. With `variety` above 0, that fraction of hits is reported as a miss
+    instead, so a fresh reply gets generated and added to the variants.
+    """
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE, path=RESPONSE_CACHE_PATH, variety=RESPONSE_CACHE_VARIETY,
+                 max_variants=RESPONSE_CACHE_VARIANTS, rng=random):
+        self.max_entries = max_entries
+        self.path = path
+        self.variety = variety
+        self.max_variants = max_variants
+        self.rng = rng
+        self.entries = OrderedDict()  # key -> list of replies
+        self.hits = 0
+        self.misses = 0
+        # Dialogue worker threads read and write the cache concurrently
+        self.lock = threading.Lock()
+        if path:
+            self.load()
+
+    def key(self, npc, player_input):
+        """Build the cache key for `npc` answering `player_input`."""
+        history = npc.interaction_history[-RESPONSE_CACHE_HISTORY:] if RESPONSE_CACHE_HISTORY else []
+        return (npc.name, npc.job, npc.environment, npc.personality, npc.hobby,
+                '\n'.join(history), normalize_input(player_input))
+
+    def get(self, key):
+        """Return a cached reply for `key`, or None on a miss."""
+        with self.lock:
+            variants = self.entries.get(key)
+            if variants is None or (self.variety and self.rng.random() < self.variety):
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.rng.choice(variants)
+
+    def put(self, key, response):
+        """Store `response` for `key`, evicting the least recently used keys over the limit."""
+        with self.lock:
+            variants = self.entries.setdefault(key, [])
+            if response not in variants:
+                variants.append(response)
+                del variants[:-self.max_variants]
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        """Return hit/miss counters and the current size."""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': len(self.entries),
+        }
+
+    def load(self):
+        """Read cached replies from `path`; a missing or unreadable file leaves the cache empty."""
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        with self.lock:
+            for key, variants in saved:
+                self.entries[tuple(key)] = variants[-self.max_variants:]
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def save(self):
+        """Write the cache to `path` (least recently used first) so it survives restarts."""
+        if not self.path:
+            return
+        with self.lock:
+            saved = [[list(key), variants] for key, variants in self.entries.items()]
+        # Write to a temporary file first so a crash never leaves a half-written cache
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(saved, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.misses = 0
+
+_response_cache = None
+
+def get_response_cache() -> ResponseCache:
+    """Return the shared ResponseCache, loading it from disk on first use."""
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = ResponseCache()
+    return _response_cache
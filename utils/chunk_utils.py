@@ -0,0 +1,224 @@
+import pygame
+import random
+import numpy as np
+from collections import OrderedDict
+from config import (GRID_SIZE, MAZE_WIDTH, MAZE_HEIGHT, MAZE_SEED, CHUNK_SIZE, CHUNK_CACHE_MB,
+                    NUM_FOOD, NUM_DRINKS, NUM_TOOLS)
+from utils.display_utils import game_to_screen, camera
+from utils.maze_utils import Maze, WALL, FLOOR
+
+class ChunkedMaze:
+    """An unbounded maze built from fixed-size chunks that are generated on first access.
+
+    Each chunk is a small `Maze` carved from a seed derived from the world seed
+    and the chunk coordinates, so a chunk always comes out the same no matter
+    when or how often it is generated. A chunk owns its top row and left column
+    as a border wall and opens one door in each, which links it to its north
+    and west neighbours; every chunk doing the same keeps the whole world connected.
+
+    Chunks are kept in an LRU cache and the least recently used ones are dropped
+    once the cache goes over its memory budget. Cell edits (e.g. picked up items)
+    are remembered separately and re-applied when a dropped chunk is regenerated.
+    """
+    def __init__(self, seed=None, chunk_size=CHUNK_SIZE, cache_mb=CHUNK_CACHE_MB):
+        if chunk_size < 4 or chunk_size % 2:
+            raise ValueError(f"chunk_size must be an even number >= 4, got {chunk_size}")
+
+        if seed is None:
+            seed = MAZE_SEED if MAZE_SEED != -1 else random.getrandbits(32)
+        self.seed = seed
+        self.chunk_size = chunk_size
+        self.max_cache_bytes = int(cache_mb * 1024 * 1024)
+
+        self.chunks = OrderedDict()  # (cx, cy) -> Maze, least recently used first
+        self.chunk_sizes = {}  # (cx, cy) -> bytes held by that cached chunk when last measured
+        self.cache_bytes = 0  # Running total of chunk_sizes
+        self.edits = {}  # (cx, cy) -> {(x, y): cell value}, survives chunk eviction
+        self.items_per_chunk = (NUM_FOOD, NUM_DRINKS, NUM_TOOLS)
+        self.grid = ChunkedGrid(self)
+
+    def chunk_coords(self, x, y):
+        """Return the (cx, cy) coordinates of the chunk holding world cell (x, y)."""
+        return x // self.chunk_size, y // self.chunk_size
+
+    def get_chunk(self, cx, cy):
+        """Return the chunk at (cx, cy), generating it if it isn't cached."""
+        chunk = self.chunks.get((cx, cy))
+        if chunk is None:
+            chunk = self.generate_chunk(cx, cy)
+            self.chunks[cx, cy] = chunk
+            self.measure(cx, cy)
+            self.evict()
+        else:
+            self.chunks.move_to_end((cx, cy))
+        return chunk
+
+    def generate_chunk(self, cx, cy):
+        """Carve the chunk at (cx, cy) deterministically from the world seed."""
+        size = self.chunk_size
+        rng = random.Random(f"{self.seed}:{cx}:{cy}")
+        chunk = Maze(size, size, rng=rng)
+        chunk.origin = (cx * size, cy * size)
+        chunk.generate()
+
+        # The top row and left column are this chunk's border with its north and west neighbours
+        chunk.grid[0, :] = WALL
+        chunk.grid[:, 0] = WALL
+        # Doors sit on odd offsets, which are always carved cells on both sides of the border
+        chunk.grid[rng.randrange(size // 2) * 2 + 1, 0] = FLOOR
+        chunk.grid[0, rng.randrange(size // 2) * 2 + 1] = FLOOR
+
+        if any(self.items_per_chunk):
+            chunk.place_items(*self.items_per_chunk)
+
+        # Re-apply edits made before this chunk was last evicted
+        x0, y0 = chunk.origin
+        for (x, y), value in self.edits.get((cx, cy), {}).items():
+            chunk.grid[y - y0, x - x0] = value
+        chunk.invalidate()
+        return chunk
+
+    def chunk_bytes(self, chunk):
+        """Return the memory held by a cached chunk, including its rendered background."""
+        size = chunk.grid.nbytes
+        for block in chunk.blocks.values():
+            size += block.get_bytesize() * block.get_width() * block.get_height()
+        return size
+
+    def measure(self, cx, cy):
+        """Update the running cache total with the current size of the cached chunk at (cx, cy)."""
+        chunk = self.chunks.get((cx, cy))
+        if chunk is None:
+            return  # Already evicted
+        size = self.chunk_bytes(chunk)
+        self.cache_bytes += size - self.chunk_sizes.get((cx, cy), 0)
+        self.chunk_sizes[cx, cy] = size
+
+    def evict(self):
+        """Drop least recently used chunks until the cache fits its memory budget."""
+        # Always keep the most recently used chunk, even if it alone is over budget
+        while self.cache_bytes > self.max_cache_bytes and len(self.chunks) > 1:
+            key, _ = self.chunks.popitem(last=False)
+            self.cache_bytes -= self.chunk_sizes.pop(key)
+
+    def clear_cache(self):
+        """Drop every cached chunk."""
+        self.chunks.clear()
+        self.chunk_sizes.clear()
+        self.cache_bytes = 0
+
+    def generate(self):
+        """Forget every generated chunk; chunks are carved lazily on first access."""
+        self.clear_cache()
+        self.edits.clear()
+
+    def place_items(self, num_food: int = 1, num_drink: int = 1, num_tools: int = 1):
+        """Set how many items of each class every chunk gets when it is generated."""
+        self.items_per_chunk = (num_food, num_drink, num_tools)
+        self.clear_cache()  # Regenerate cached chunks with the new item counts
+
+    def get_cell(self, x, y):
+        """Return the grid value at world cell (x, y)."""
+        cx, cy = self.chunk_coords(x, y)
+        chunk = self.get_chunk(cx, cy)
+        return chunk.grid[y - cy * self.chunk_size, x - cx * self.chunk_size]
+
+    def set_cell(self, x, y, value):
+        """Set the grid value at world cell (x, y) and remember it across evictions."""
+        cx, cy = self.chunk_coords(x, y)
+        chunk = self.get_chunk(cx, cy)
+        chunk.set_cell(x - cx * self.chunk_size, y - cy * self.chunk_size, value)
+        self.edits.setdefault((cx, cy), {})[x, y] = value
+
+    def is_wall(self, x, y):
+        """Check if the given position (x, y) is a wall. The world has no bounds."""
+        return self.get_cell(x, y) == WALL
+
+    def walls_at(self, xs, ys):
+        """Check a batch of cells at once, returning a boolean array that is True on walls."""
+        return np.array([self.is_wall(x, y) for x, y in zip(np.asarray(xs).tolist(), np.asarray(ys).tolist())],
+                        dtype=bool)
+
+    def clear_line(self, x0, y0, x1, y1):
+        """Check that no cell after (x0, y0) up to (x1, y1) along a row or column is a wall."""
+        if x0 != x1 and y0 != y1:
+            return False
+        dx = (x1 > x0) - (x1 < x0)
+        dy = (y1 > y0) - (y1 < y0)
+        x, y = x0, y0
+        while (x, y) != (x1, y1):
+            x, y = x + dx, y + dy
+            if self.is_wall(x, y):
+                return False
+        return True
+
+    def item_at(self, x, y):
+        """Return the item ID at (x, y), or None if there is no item there."""
+        cx, cy = self.chunk_coords(x, y)
+        return self.get_chunk(cx, cy).item_at(x - cx * self.chunk_size, y - cy * self.chunk_size)
+
+    def chunks_in(self, x0, y0, x1, y1):
+        """Yield the chunks overlapping the half-open box [x0, x1) x [y0, y1)."""
+        cx0, cy0 = self.chunk_coords(x0, y0)
+        cx1, cy1 = self.chunk_coords(x1 - 1, y1 - 1)
+        for cy in range(cy0, cy1 + 1):
+            for cx in range(cx0, cx1 + 1):
+                yield self.get_chunk(cx, cy)
+
+    def find_open_spaces(self, x0=0, y0=0, x1=MAZE_WIDTH, y1=MAZE_HEIGHT):
+        """Return the open (x, y) cells inside [x0, x1) x [y0, y1), screen area by default."""
+        open_spaces = []
+        for chunk in self.chunks_in(x0, y0, x1, y1):
+            ox, oy = chunk.origin
+            for x, y in chunk.find_open_spaces():
+                x, y = x + ox, y + oy
+                if x0 <= x < x1 and y0 <= y < y1:
+                    open_spaces.append((x, y))
+        return open_spaces
+
+    def draw(self, screen, x0=None, y0=None, x1=None, y1=None, areas=None):
+        """Draw the chunks covering [x0, x1) x [y0, y1), clipped to that area on screen.
+
+        The area defaults to the camera view. It is always redrawn whole
+        (`areas` is accepted for the same call as Maze.draw), so it is returned
+        as the changed rect.
+        """
+        if x0 is None:
+            x0, y0, x1, y1 = camera.view_cells()
+        left, top = game_to_screen(x0, y0)
+        view = pygame.Rect(left, top, (x1 - x0) * GRID_SIZE, (y1 - y0) * GRID_SIZE)
+        previous_clip = screen.get_clip()
+        screen.set_clip(view)
+        for chunk in list(self.chunks_in(x0, y0, x1, y1)):
+            chunk.draw(screen)
+            self.measure(*self.chunk_coords(*chunk.origin))  # Rendering may have grown its cached blocks
+        screen.set_clip(previous_clip)
+        self.evict()
+        return [view]
+
+class ChunkedGrid:
+    """Indexable view of a ChunkedMaze so `grid[y][x]` and `grid[y, x]` work like on `Maze.grid`."""
+    def __init__(self, world):
+        self.world = world
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            y, x = key
+            return self.world.get_cell(x, y)
+        return ChunkedRow(self.world, key)
+
+    def __setitem__(self, key, value):
+        y, x = key
+        self.world.set_cell(x, y, value)
+
+class ChunkedRow:
+    """A single row of a ChunkedGrid."""
+    def __init__(self, world, y):
+        self.world = world
+        self.y = y
+
+    def __getitem__(self, x):
+        return self.world.get_cell(x, self.y)
+
+    def __setitem__(self, x, value):
+        self.world.set_cell(x, self.y, value)
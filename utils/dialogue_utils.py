@@ -1,31 +1,115 @@
 import pygame
-from config import SCREEN_WIDTH, SCREEN_HEIGHT, BLACK, WHITE
+import threading
+import traceback
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from config import SCREEN_WIDTH, SCREEN_HEIGHT, BLACK, WHITE, DIALOGUE_WORKERS, LLM_STREAMING
+from utils.text_utils import render_text
+
+@lru_cache(maxsize=256)
+def wrap_text(font, text, max_width):
+    """Split `text` into lines that each render no wider than `max_width` pixels.
+
+    Results are cached, so a message shown for many frames is only measured once.
+    """
+    lines = []
+    line = ''
+    for word in text.split(' '):
+        candidate = f"{line} {word}" if line else word
+        if font.size(candidate)[0] <= max_width:
+            line = candidate
+            continue
+        if line:
+            lines.append(line)
+        # Break words too long for a line of their own
+        while font.size(word)[0] > max_width and len(word) > 1:
+            cut = len(word) - 1
+            while cut > 1 and font.size(word[:cut])[0] > max_width:
+                cut -= 1
+            lines.append(word[:cut])
+            word = word[cut:]
+        line = word
+    lines.append(line)
+    return tuple(lines)
 
 def draw_dialogue_box(screen, font, npc_message, user_message, item_message=None):
-    """Draw the dialogue box at the bottom of the screen."""
-    dialogue_box_rect = pygame.Rect(0, SCREEN_HEIGHT - 100, SCREEN_WIDTH, 100)
-    pygame.draw.rect(screen, WHITE, dialogue_box_rect)
+    """Draw the dialogue box at the bottom of the screen.
 
-    # If there is an item message, show it at the top of the box
+    Messages wrap to the box width and the box grows upward to fit them, so a
+    reply streaming in stays readable as it gets longer. Returns the box's rect.
+    """
+    text_width = SCREEN_WIDTH - 20
     if item_message:
-        item_text_surface = font.render(f"{item_message}", True, BLACK)
-        screen.blit(item_text_surface, (10, SCREEN_HEIGHT - 90))
+        lines = wrap_text(font, f"{item_message}", text_width)
     else:
-        # NPC message
-        npc_text_surface = font.render(f"NPC: {npc_message}", True, BLACK)
-        screen.blit(npc_text_surface, (10, SCREEN_HEIGHT - 90))
+        lines = wrap_text(font, f"NPC: {npc_message}", text_width) + wrap_text(font, f"You: {user_message}", text_width)
 
-        # User message
-        user_text_surface = font.render(f"You: {user_message}", True, BLACK)
-        screen.blit(user_text_surface, (10, SCREEN_HEIGHT - 60))
+    line_height = 30
+    box_height = max(100, 20 + line_height * len(lines))
+    box_top = SCREEN_HEIGHT - box_height
+    dialogue_box_rect = pygame.Rect(0, box_top, SCREEN_WIDTH, box_height)
+    pygame.draw.rect(screen, WHITE, dialogue_box_rect)
 
-def player_near_npc(player_pos, npc):
-    """Check if the player is within 1 square of the NPC."""
-    return abs(player_pos[0] - npc.x) <= 1 and abs(player_pos[1] - npc.y) <= 1
+    # Item message, or the NPC message followed by the user message
+    for index, line in enumerate(lines):
+        text_surface = render_text(font, line, BLACK)
+        screen.blit(text_surface, (10, box_top + 10 + index * line_height))
+    return dialogue_box_rect
 
 def handle_npc_response(npc_message, user_input, conversation_counter):
     """Handle the NPC's response based on conversation count."""
     if conversation_counter < 10:
         return user_input if user_input else "(silence)"
     else:
-        return "...just leave idiot"
\ No newline at end of file
+        return "...just leave idiot"
+
+class DialogueHandle:
+    """A pending NPC reply that the game loop polls each frame instead of waiting on.
+
+    While the reply is generating, `partial` holds the text streamed in so far.
+    """
+    def __init__(self, npc, future, cancel_event):
+        self.npc = npc
+        self.future = future
+        self.cancel_event = cancel_event
+        self.partial = ""
+
+    def append_text(self, text):
+        """Add a newly generated piece of the reply; called from the generating thread."""
+        self.partial += text
+
+    def done(self):
+        """Check if the reply is ready (or the request was cancelled)."""
+        return self.future.done()
+
+    def result(self):
+        """Return the reply once `done()`; a failed generation falls back to a canned line."""
+        if self.future.cancelled():
+            return None
+        error = self.future.exception()
+        if error is not None:
+            traceback.print_exception(error)
+            return self.npc.get_fallback_response()
+        return self.future.result()
+
+    def cancel(self):
+        """Stop waiting for the reply and ask the generation to stop early."""
+        self.cancel_event.set()
+        self.future.cancel()
+
+class DialogueService:
+    """Runs NPC replies on worker threads so the render loop never blocks on the LLM."""
+    def __init__(self, max_workers=DIALOGUE_WORKERS):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='dialogue')
+
+    def request(self, npc, player_input):
+        """Start generating `npc`'s reply to `player_input` and return a DialogueHandle for it."""
+        cancel_event = threading.Event()
+        handle = DialogueHandle(npc, None, cancel_event)
+        on_text = handle.append_text if LLM_STREAMING else None
+        handle.future = self.executor.submit(npc.npc_chat, player_input, cancel_event, on_text)
+        return handle
+
+    def shutdown(self):
+        """Drop queued requests and let running ones finish in the background."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -1,9 +1,113 @@
 import random
-from config import GRID_SIZE, HUD_HEIGHT
+import pygame
+from config import GRID_SIZE, HUD_HEIGHT, VIEW_WIDTH, VIEW_HEIGHT, CAMERA_MARGIN
+
+class Camera:
+    """The window onto the maze: (x, y) is the world cell drawn at the top-left of the play area."""
+    def __init__(self, view_width=VIEW_WIDTH, view_height=VIEW_HEIGHT, margin=CAMERA_MARGIN):
+        self.view_width = view_width
+        self.view_height = view_height
+        self.margin = margin
+        self.x = 0
+        self.y = 0
+
+    def follow(self, x, y, width=None, height=None):
+        """Keep (x, y) in view, kept inside a `width` x `height` maze if given.
+
+        The view stays put while (x, y) is more than `margin` cells from its
+        edges and re-centres on it once it gets closer, so a scroll (and the
+        full redraw that comes with it) happens every few steps rather than on
+        every one. Mazes smaller than the view don't scroll. Returns True if the view moved.
+        """
+        margin_x = min(self.margin, (self.view_width - 1) // 2)
+        margin_y = min(self.margin, (self.view_height - 1) // 2)
+        new_x, new_y = self.x, self.y
+        if not self.x + margin_x <= x < self.x + self.view_width - margin_x:
+            new_x = x - self.view_width // 2
+        if not self.y + margin_y <= y < self.y + self.view_height - margin_y:
+            new_y = y - self.view_height // 2
+        if width is not None:
+            new_x = max(0, min(new_x, width - self.view_width))
+        if height is not None:
+            new_y = max(0, min(new_y, height - self.view_height))
+        moved = (new_x, new_y) != (self.x, self.y)
+        self.x, self.y = new_x, new_y
+        return moved
+
+    def sees(self, x, y):
+        """Check if world cell (x, y) is inside the view."""
+        return self.x <= x < self.x + self.view_width and self.y <= y < self.y + self.view_height
+
+    def view_cells(self):
+        """Return the visible cells as the half-open box (x0, y0, x1, y1)."""
+        return self.x, self.y, self.x + self.view_width, self.y + self.view_height
+
+# Shared by everything that draws in world coordinates
+camera = Camera()
 
 def game_to_screen(x, y):
-    """Convert game grid coordinates to screen pixel coordinates."""
-    screen_x = x * GRID_SIZE
-    screen_y = y * GRID_SIZE + HUD_HEIGHT  # Apply HUD_HEIGHT offset
+    """Convert game grid coordinates to screen pixel coordinates, relative to the camera.
+
+    Works element-wise on numpy arrays too.
+    """
+    screen_x = (x - camera.x) * GRID_SIZE
+    screen_y = (y - camera.y) * GRID_SIZE + HUD_HEIGHT  # Apply HUD_HEIGHT offset
     return screen_x, screen_y
 
+
+class DirtyRects:
+    """Tracks which parts of the screen changed so only those are sent to the display.
+
+    Each frame, everything drawn registers its screen rect (and, optionally, a
+    value describing what it shows) with `track`; `add` takes rects that
+    changed outright, like redrawn maze tiles. `present` then updates only the
+    rects of things that appeared, disappeared, moved or changed since the
+    last frame. After `invalidate` (a layout change such as opening the
+    inventory) the next `present` flips the whole screen instead.
+    """
+    def __init__(self):
+        self.full = True  # The first frame always goes out whole
+        self.previous = {}  # key -> (rect, state) drawn last frame
+        self.current = {}
+        self.changed = []
+
+    def invalidate(self):
+        """Redraw and send the whole screen next frame."""
+        self.full = True
+
+    def track(self, key, rect, state=None):
+        """Register that `key` was drawn at `rect` this frame, showing `state`."""
+        self.current[key] = (pygame.Rect(rect), state)
+
+    def add(self, rects):
+        """Register rects that changed this frame regardless of what was tracked."""
+        self.changed.extend(rects)
+
+    def previous_rects(self):
+        """Return the rects drawn last frame; their background needs restoring before drawing over them."""
+        return [rect for rect, _ in self.previous.values()]
+
+    def present(self):
+        """Send this frame's changes to the display and start the next frame. Returns the rects updated, or None after a full flip."""
+        if self.full:
+            pygame.display.flip()
+            dirty = None
+        else:
+            dirty = self.changed
+            previous, current = self.previous, self.current
+            for key, (rect, state) in current.items():
+                old = previous.get(key)
+                if old is None:
+                    dirty.append(rect)
+                elif old[0] != rect or old[1] != state:
+                    dirty.append(old[0])
+                    dirty.append(rect)
+            for key, (rect, _) in previous.items():
+                if key not in current:
+                    dirty.append(rect)
+            if dirty:
+                pygame.display.update(dirty)
+
+        self.previous, self.current, self.changed = self.current, {}, []
+        self.full = False
+        return dirty
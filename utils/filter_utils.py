@@ -0,0 +1,58 @@
+import re
+import threading
+
+# Terms NPC replies must not contain, matched anywhere in the text regardless of case
+BANNED_WORDS = ['chibi', 'loli', 'shota', 'nsfw']
+
+class ContentFilter:
+    """Checks text for banned terms with one precompiled pattern, whatever the length of the word list."""
+    def __init__(self, words=BANNED_WORDS):
+        # Longest first so overlapping terms report the longer match
+        terms = sorted(words, key=len, reverse=True)
+        self.pattern = re.compile('|'.join(re.escape(term) for term in terms), re.IGNORECASE)
+        self.longest = max((len(term) for term in terms), default=0)
+
+    def is_appropriate(self, text: str) -> bool:
+        """Check that `text` contains none of the banned terms."""
+        return self.pattern.search(text) is None
+
+    def scanner(self, cancel_event=None, on_text=None):
+        """Return a StreamScanner that checks a reply piece by piece while it generates."""
+        return StreamScanner(self, cancel_event, on_text)
+
+class AnyEvent:
+    """Stands in for a threading.Event that is set as soon as any of `events` is."""
+    def __init__(self, *events):
+        self.events = [event for event in events if event is not None]
+
+    def is_set(self):
+        return any(event.is_set() for event in self.events)
+
+class StreamScanner:
+    """Scans generated text as it arrives and stops generation at the first banned term.
+
+    Pass `feed` to a backend as its `on_text` callback and `cancel_event` as its
+    cancel event. Only the new text plus a short tail of what came before is
+    searched, so terms split across pieces are still caught. Pieces are passed
+    on to `on_text` until a term is found; after that `cancel_event` is set
+    (ending generation) and nothing more is passed on.
+    """
+    def __init__(self, content_filter, cancel_event=None, on_text=None):
+        self.filter = content_filter
+        self.on_text = on_text
+        self.blocked = threading.Event()
+        self.cancel_event = AnyEvent(cancel_event, self.blocked)
+        self.tail = ''
+
+    def feed(self, text: str):
+        if self.blocked.is_set():
+            return
+        window = self.tail + text
+        if self.filter.pattern.search(window):
+            self.blocked.set()
+            return
+        self.tail = window[-(self.filter.longest - 1):] if self.filter.longest > 1 else ''
+        if self.on_text is not None:
+            self.on_text(text)
+
+content_filter = ContentFilter()
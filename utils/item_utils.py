@@ -1,118 +1,162 @@
 class Item:
-    """Base class for all items."""
-    def __init__(self, name, quantity=1):
-        self.name = name
-        self.quantity = quantity
+    """Base class for all item types.
+
+    An item type is a shared, read-only definition: one instance per item ID
+    lives in `item_registry`. What differs between copies of an item (how
+    many, uses left) lives in an ItemStack, which only stores the type's ID.
+    """
+    __slots__ = ('item_id', 'name')
+    color = (255, 255, 255)  # Drawn on the maze in this color
+    uses = None  # Only tools wear out
+
+    def __init__(self, item_id, name, **attributes):
+        object.__setattr__(self, 'item_id', item_id)
+        object.__setattr__(self, 'name', name)
+        for attribute, value in attributes.items():
+            object.__setattr__(self, attribute, value)
+
+    def __setattr__(self, attribute, value):
+        raise AttributeError(f"Item types are shared and read-only; can't set {attribute} on {self.name}")
 
-    def use(self):
-        """Use the item."""
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.item_id}, {self.name!r})"
+
+    def use(self, player, stack):
+        """Use one item from `stack`."""
+        stack.quantity -= 1
         return f"You used the {self.name}."
 
-    def give(self):
-        """Give the item to someone."""
+    def give(self, stack):
+        """Give one item from `stack` to someone."""
+        stack.quantity -= 1
+        stack.uses = self.uses  # A worn tool goes with it; the next one in the stack is fresh
         return f"You gave away the {self.name}."
-    
-    def clone(self):
-        return self.__class__(self.name, self.quantity)
 
 class Food(Item):
     """Represents food items."""
-    def __init__(self, name, quantity=1, nutrition_value=10, health_value=0):
-        super().__init__(name, quantity)
-        self.nutrition_value = nutrition_value
-        self.health_value = health_value
-        
-    def use(self, player):
-        """Use the food item and feed the player."""
+    __slots__ = ('nutrition_value', 'health_value')
+    color = (255, 215, 0)  # Gold color for food
+
+    def __init__(self, item_id, name, nutrition_value=10, health_value=0):
+        super().__init__(item_id, name, nutrition_value=nutrition_value, health_value=health_value)
+
+    def use(self, player, stack):
+        """Eat one item from `stack` and feed the player."""
+        stack.quantity -= 1
         player.hunger += self.nutrition_value
         player.hunger = min(player.hunger, player.max_hunger)
         player.health += self.health_value
         player.health = min(player.health, player.max_health)
         return f"You ate the {self.name}. It fills your stomach."
-    
-    def clone(self):
-        return Food(self.name, self.quantity, self.nutrition_value, self.health_value)
 
 class Drink(Item):
     """Represents drink items."""
-    def __init__(self, name, quantity=1, hydration_value=10, health_value=0):
-        super().__init__(name, quantity)
-        self.hydration_value = hydration_value
-        self.health_value = health_value
-        
-    def use(self, player):
-        """Use the drink item and reduce thirst."""
+    __slots__ = ('hydration_value', 'health_value')
+    color = (30, 144, 255)  # Blue color for drinks
+
+    def __init__(self, item_id, name, hydration_value=10, health_value=0):
+        super().__init__(item_id, name, hydration_value=hydration_value, health_value=health_value)
+
+    def use(self, player, stack):
+        """Drink one item from `stack` and reduce thirst."""
+        stack.quantity -= 1
         player.thirst += self.hydration_value
         player.thirst = min(player.thirst, player.max_thirst)
         player.health += self.health_value
         player.health = min(player.health, player.max_health)
         return f"You drank the {self.name}. It quenches your thirst."
-    
-    def clone(self):
-        return Drink(self.name, self.quantity, self.hydration_value, self.health_value)
 
 class Tool(Item):
     """Represents tool items.
     1. Types can be 'bludgeon', 'cutting', 'digging', 'climbing'
     2. Hunger and thirst costs are the values deducted from the player's hunger and thirst levels when using the tool.
-    3. Uses is the number of times the tool can be used before it breaks. 
+    3. Uses is the number of times the tool can be used before it breaks.
     """
-    def __init__(self, name, quantity=1, type = 'bludgeon', hunger_cost = 0, thirst_cost = 0, uses = 2):
-        self.type = type
-        self.hunger_cost = hunger_cost
-        self.thirst_cost = thirst_cost
-        self.uses = uses
-        super().__init__(name, quantity)
-        
-    def use(self, player):
-        """Use the tool item."""
-        self.uses -= 1
-        
+    __slots__ = ('type', 'hunger_cost', 'thirst_cost', 'uses')
+    color = (255, 0, 255)  # Magenta color for tools
+
+    def __init__(self, item_id, name, type='bludgeon', hunger_cost=0, thirst_cost=0, uses=2):
+        super().__init__(item_id, name, type=type, hunger_cost=hunger_cost, thirst_cost=thirst_cost, uses=uses)
+
+    def use(self, player, stack):
+        """Use the top tool of `stack`; it is removed from the stack once it breaks."""
+        stack.uses -= 1
+
         player.hunger -= self.hunger_cost
         player.hunger = max(player.hunger, 0)
         player.thirst -= self.thirst_cost
         player.thirst = max(player.thirst, 0)
-        
-        if self.uses == 0:
-            ##Need to subtract item
+
+        if stack.uses <= 0:
+            stack.quantity -= 1
+            stack.uses = self.uses  # The next tool in the stack is a fresh one
             return f"The {self.name} broke."
-        
+
         return f"You used the {self.name}. It helps you with tasks."
-    
-    def clone(self):
-        return Tool(self.name, self.quantity, self.type, self.hunger_cost, self.thirst_cost, self.uses)
-    
+
+class ItemStack:
+    """A pile of items of one type: the type's ID plus the state that isn't shared.
+
+    `uses` is what is left on the top tool of a stack of tools, None for other items.
+    """
+    __slots__ = ('item_id', 'quantity', 'uses')
+
+    def __init__(self, item_id, quantity=1, uses=None):
+        self.item_id = item_id
+        self.quantity = quantity
+        self.uses = item_registry[item_id].uses if uses is None else uses
+
+    @property
+    def item(self):
+        """The shared item type for this stack."""
+        return item_registry[self.item_id]
+
+    @property
+    def name(self):
+        return item_registry[self.item_id].name
+
+    def use(self, player):
+        return self.item.use(player, self)
+
+    def give(self):
+        return self.item.give(self)
+
 ##
 # For item registries, food will start with 200,
 # drinks with 300, and tools with 400
-## 
-
-ENTITY_IDS = {
-    200: "bread",
-    201: "apple",
-    202: "steak",
-    203: "fried rice",
-    300: "water",
-    301: "juice",
-    302: "tea",
-    303: "coffee",
-    400: "hammer",
-    401: "saw",
-    402: "pickaxe",
-    403: "rope"
-}
-
-item_registry  = {
-    200: Food('bread', nutrition_value=20),
-    201: Food('apple', nutrition_value=10),
-    202: Food('steak', nutrition_value=25, health_value=15),
-    203: Food('fried rice', nutrition_value=30, health_value=30),
-    300: Drink('water', hydration_value=10),
-    301: Drink('juice', hydration_value=15, health_value=5),
-    302: Drink('tea', hydration_value=20, health_value=10),
-    303: Drink('coffee', hydration_value=10, health_value=5),
-    400: Tool('hammer', type='bludgeon', hunger_cost=5, thirst_cost=5, uses=3),   
-    401: Tool('saw', type='cutting', hunger_cost=5, thirst_cost=5, uses=3),
-    402: Tool('pickaxe', type='digging', hunger_cost=5, thirst_cost=5, uses=3),
-    403: Tool('rope', type='climbing', hunger_cost=5, thirst_cost=5, uses=3)
-    }
\ No newline at end of file
+##
+
+item_registry = {item.item_id: item for item in (
+    Food(200, 'bread', nutrition_value=20),
+    Food(201, 'apple', nutrition_value=10),
+    Food(202, 'steak', nutrition_value=25, health_value=15),
+    Food(203, 'fried rice', nutrition_value=30, health_value=30),
+    Drink(300, 'water', hydration_value=10),
+    Drink(301, 'juice', hydration_value=15, health_value=5),
+    Drink(302, 'tea', hydration_value=20, health_value=10),
+    Drink(303, 'coffee', hydration_value=10, health_value=5),
+    Tool(400, 'hammer', type='bludgeon', hunger_cost=5, thirst_cost=5, uses=3),
+    Tool(401, 'saw', type='cutting', hunger_cost=5, thirst_cost=5, uses=3),
+    Tool(402, 'pickaxe', type='digging', hunger_cost=5, thirst_cost=5, uses=3),
+    Tool(403, 'rope', type='climbing', hunger_cost=5, thirst_cost=5, uses=3),
+)}
+
+# Item IDs by name, for code that refers to items by what they are called
+ITEM_IDS_BY_NAME = {item.name: item_id for item_id, item in item_registry.items()}
+
+# Item IDs grouped by item class, so placement can draw straight from the right category
+ITEM_IDS_BY_CLASS = {}
+for _item_id, _item in item_registry.items():
+    ITEM_IDS_BY_CLASS.setdefault(type(_item), []).append(_item_id)
+
+def register_item(item):
+    """Add a new item type to the registries (e.g. a new Food, or an instance of a new Item subclass)."""
+    if item.item_id in item_registry:
+        raise ValueError(f"Item ID {item.item_id} is already registered to {item_registry[item.item_id].name}")
+    item_registry[item.item_id] = item
+    ITEM_IDS_BY_NAME[item.name] = item.item_id
+    ITEM_IDS_BY_CLASS.setdefault(type(item), []).append(item.item_id)
+
+def item_ids_of(cls):
+    """Return the IDs of every registered item that is an instance of `cls` (subclasses included)."""
+    return [item_id for item_cls, ids in ITEM_IDS_BY_CLASS.items() if issubclass(item_cls, cls) for item_id in ids]
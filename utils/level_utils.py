@@ -0,0 +1,111 @@
+import os
+import random
+import struct
+import numpy as np
+from config import (MAZE_WIDTH, MAZE_HEIGHT, MAZE_SEED, NUM_FOOD, NUM_DRINKS, NUM_TOOLS, LEVEL_CACHE_DIR,
+                    MIN_HALLWAY_SIZE, MAX_HALLWAY_SIZE)
+from utils.maze_utils import Maze, GRID_DTYPE
+
+##
+# Level file layout (little-endian):
+#   header   magic b'MZLV', format version, seed, width, height, spawn count
+#   spawns   one (kind, x, y) record per spawn point, kind indexes SPAWN_KINDS
+#   padding  zero bytes up to a 16-byte boundary
+#   grid     height * width uint16 cells (walls, floor and item IDs), row-major
+##
+
+LEVEL_MAGIC = b'MZLV'
+LEVEL_VERSION = 1
+HEADER = struct.Struct('<4sHqIIH')
+SPAWN = struct.Struct('<HII')
+GRID_ALIGNMENT = 16
+# Bump whenever carving or item placement changes, so cached levels from older code aren't reused
+GENERATOR_VERSION = 2
+
+# Things that get a spawn point in every level
+SPAWN_KINDS = ('player', 'static_npc', 'random_npc', 'aggressive_npc')
+
+def grid_offset(num_spawns):
+    """Return the byte offset of the grid in a level file with `num_spawns` spawn points."""
+    offset = HEADER.size + SPAWN.size * num_spawns
+    return -(-offset // GRID_ALIGNMENT) * GRID_ALIGNMENT
+
+def save_level(path, maze, spawns, seed=-1):
+    """Write a maze and its {kind: (x, y)} spawn points to `path`."""
+    offset = grid_offset(len(spawns))
+    header = HEADER.pack(LEVEL_MAGIC, LEVEL_VERSION, seed, maze.width, maze.height, len(spawns))
+    records = b''.join(SPAWN.pack(SPAWN_KINDS.index(kind), x, y) for kind, (x, y) in spawns.items())
+
+    # Write to a temporary file first so a crash never leaves a half-written level behind
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        f.write(records)
+        f.write(b'\0' * (offset - len(header) - len(records)))
+        f.write(np.ascontiguousarray(maze.grid, dtype='<u2').tobytes())
+    os.replace(tmp_path, path)
+
+def load_level(path, mmap=True):
+    """Load a level written by `save_level` and return (maze, spawns, seed).
+
+    With `mmap` the grid is memory-mapped copy-on-write: pages are read from disk
+    as they are touched and in-game edits never reach the file.
+    """
+    with open(path, 'rb') as f:
+        magic, version, seed, width, height, num_spawns = HEADER.unpack(f.read(HEADER.size))
+        if magic != LEVEL_MAGIC:
+            raise ValueError(f"{path} is not a level file")
+        if version != LEVEL_VERSION:
+            raise ValueError(f"{path} has unsupported level format version {version}")
+
+        spawns = {}
+        for _ in range(num_spawns):
+            kind, x, y = SPAWN.unpack(f.read(SPAWN.size))
+            spawns[SPAWN_KINDS[kind]] = (x, y)
+
+    offset = grid_offset(num_spawns)
+    if mmap:
+        grid = np.memmap(path, dtype='<u2', mode='c', offset=offset, shape=(height, width))
+    else:
+        grid = np.fromfile(path, dtype='<u2', count=width * height, offset=offset).reshape(height, width)
+    return Maze(grid=grid.astype(GRID_DTYPE, copy=False)), spawns, seed
+
+def generate_level(width=MAZE_WIDTH, height=MAZE_HEIGHT, num_food=NUM_FOOD, num_drink=NUM_DRINKS, num_tools=NUM_TOOLS,
+                   seed=-1):
+    """Generate a maze, scatter items and pick a distinct open cell for every spawn kind.
+
+    The same seed always gives the same level; seed -1 uses the global `random` state.
+    """
+    rng = random.Random(seed) if seed != -1 else random
+    maze = Maze(width, height, rng=rng)
+    maze.generate()
+    maze.place_items(num_food, num_drink, num_tools)
+
+    open_spaces = maze.find_open_spaces()
+    spawn_points = rng.sample(open_spaces, len(SPAWN_KINDS))
+    return maze, dict(zip(SPAWN_KINDS, spawn_points))
+
+def level_cache_path(seed, width, height, num_food, num_drink, num_tools, cache_dir=LEVEL_CACHE_DIR):
+    """Return the cache file for a level generated with these settings and the current generator."""
+    name = (f"level_{seed}_{width}x{height}_{num_food}-{num_drink}-{num_tools}"
+            f"_h{MIN_HALLWAY_SIZE}-{MAX_HALLWAY_SIZE}_g{GENERATOR_VERSION}.mzl")
+    return os.path.join(cache_dir, name)
+
+def load_or_generate_level(seed=MAZE_SEED, width=MAZE_WIDTH, height=MAZE_HEIGHT,
+                           num_food=NUM_FOOD, num_drink=NUM_DRINKS, num_tools=NUM_TOOLS, cache_dir=LEVEL_CACHE_DIR):
+    """Return (maze, spawns), loading the level from the cache when this seed was generated before.
+
+    Random levels (seed -1) are never cached, and nothing is cached when `cache_dir` is None.
+    """
+    if seed == -1 or cache_dir is None:
+        return generate_level(width, height, num_food, num_drink, num_tools, seed)
+
+    path = level_cache_path(seed, width, height, num_food, num_drink, num_tools, cache_dir)
+    if os.path.exists(path):
+        maze, spawns, _ = load_level(path)
+        return maze, spawns
+
+    maze, spawns = generate_level(width, height, num_food, num_drink, num_tools, seed)
+    os.makedirs(cache_dir, exist_ok=True)
+    save_level(path, maze, spawns, seed)
+    return maze, spawns
@@ -0,0 +1,490 @@
+import queue
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from config import (LLM_BACKEND, LLM_MODEL_NAME, LLM_DEVICE, LLM_MAX_LENGTH, LLM_MAX_NEW_TOKENS, LLM_TEMPERATURE,
+                    LLM_BATCH_WINDOW_MS, LLM_MAX_BATCH, LLM_PREFIX_CACHE_SIZE, LLM_PREFIX_CACHE_IDLE_S,
+                    LLM_STREAM_DELAY_MS)
+
+class LLMBackend:
+    """Text generation backend used by NPCs. Subclasses load their model on first use."""
+    can_stop_early = False  # Whether setting the cancel event from `on_text` saves generation work
+    def generate(self, prompt: str, max_new_tokens: int = LLM_MAX_NEW_TOKENS, temperature: float = LLM_TEMPERATURE,
+                 cancel_event: threading.Event = None, prefix: str = None, on_text=None) -> str:
+        """Return the text generated after `prompt`, without the prompt itself.
+
+        Generation stops early once `cancel_event` is set. `prefix` marks the
+        start of `prompt` that repeats across calls (an NPC's persona), which
+        backends may cache. `on_text`, if given, is called with each new piece of
+        the reply as it is generated; joined together the pieces are the reply.
+        """
+        raise NotImplementedError
+
+    def count_tokens(self, text: str) -> int:
+        """Estimate how many tokens `text` takes up in a prompt (roughly 4 characters per token of English)."""
+        return len(text) // 4 + 1
+
+    def token_counter(self):
+        """Identify what `count_tokens` counts with (None for the estimate); counts made with another aren't comparable."""
+        return None
+
+    def generate_batch(self, prompts: list, max_new_tokens: int = LLM_MAX_NEW_TOKENS, temperature: float = LLM_TEMPERATURE,
+                       cancel_events: list = None, prefixes: list = None, text_callbacks: list = None) -> list:
+        """Generate a reply for every prompt; backends that can run them as one batch override this."""
+        cancel_events = cancel_events or [None] * len(prompts)
+        prefixes = prefixes or [None] * len(prompts)
+        text_callbacks = text_callbacks or [None] * len(prompts)
+        return [self.generate(prompt, max_new_tokens, temperature, event, prefix, on_text)
+                for prompt, event, prefix, on_text in zip(prompts, cancel_events, prefixes, text_callbacks)]
+
+class PrefixCache:
+    """LRU cache of prompt prefixes' key/value tensors, bounded in entries and idle time.
+
+    Each entry holds whatever the backend computed for a prefix (token IDs and
+    past key/values); entries unused for `max_idle_s` seconds are dropped too.
+    """
+    def __init__(self, max_entries=LLM_PREFIX_CACHE_SIZE, max_idle_s=LLM_PREFIX_CACHE_IDLE_S):
+        self.max_entries = max_entries
+        self.max_idle_s = max_idle_s
+        self.entries = OrderedDict()  # prefix -> (value, last used time)
+
+    def get(self, prefix):
+        """Return the cached value for `prefix`, or None."""
+        self.evict_idle()
+        entry = self.entries.get(prefix)
+        if entry is None:
+            return None
+        self.entries[prefix] = (entry[0], time.monotonic())
+        self.entries.move_to_end(prefix)
+        return entry[0]
+
+    def put(self, prefix, value):
+        """Cache `value` for `prefix`, evicting the least recently used entries over the limit."""
+        self.entries[prefix] = (value, time.monotonic())
+        self.entries.move_to_end(prefix)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def evict_idle(self):
+        """Drop entries that haven't been used for `max_idle_s` seconds."""
+        cutoff = time.monotonic() - self.max_idle_s
+        while self.entries:
+            prefix, (_, last_used) = next(iter(self.entries.items()))
+            if last_used >= cutoff:
+                break
+            del self.entries[prefix]
+
+    def clear(self):
+        self.entries.clear()
+
+def cancel_criteria(*cancel_events):
+    """Build a transformers stopping criteria list that stops generation once every cancel event is set."""
+    from transformers import StoppingCriteria, StoppingCriteriaList
+
+    class CancelCriteria(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            return all(event.is_set() for event in cancel_events)
+
+    return StoppingCriteriaList([CancelCriteria()])
+
+def text_streamer(tokenizer, text_callbacks):
+    """Build a transformers streamer that passes each row's newly decoded text to its callback.
+
+    `text_callbacks` has one callable (or None) per row of the batch. Text is
+    emitted the way the finished reply is decoded: special tokens skipped and
+    leading whitespace dropped.
+    """
+    from transformers.generation.streamers import BaseStreamer
+
+    class TextCallbackStreamer(BaseStreamer):
+        def __init__(self):
+            self.prompt_seen = False
+            self.tokens = [[] for _ in text_callbacks]
+            self.emitted = [''] * len(text_callbacks)
+
+        def put(self, value):
+            # The first call carries the prompt, which isn't part of the reply
+            if not self.prompt_seen:
+                self.prompt_seen = True
+                return
+            for row, token in enumerate(value.reshape(len(text_callbacks), -1).tolist()):
+                if text_callbacks[row] is None:
+                    continue
+                self.tokens[row].extend(token)
+                text = tokenizer.decode(self.tokens[row], skip_special_tokens=True).lstrip()
+                # Hold back half-decoded characters until the rest of their bytes arrive
+                if text.endswith('\ufffd') or len(text) <= len(self.emitted[row]):
+                    continue
+                text_callbacks[row](text[len(self.emitted[row]):])
+                self.emitted[row] = text
+
+        def end(self):
+            pass
+
+    return TextCallbackStreamer()
+
+class HFBackend(LLMBackend):
+    """Hugging Face causal LM backend.
+
+    torch, transformers and the model weights are only loaded on the first
+    `generate` call, so importing this module (and starting the game) is free.
+    `device` is 'auto' to pick cuda, then mps, then cpu, or any torch device name.
+    """
+    can_stop_early = True
+    def __init__(self, model_name: str = LLM_MODEL_NAME, device: str = LLM_DEVICE):
+        self.model_name = model_name
+        self.device_name = device
+        self.device = None
+        self.tokenizer = None
+        self.model = None
+        # Generation may be called from dialogue worker threads; one call at a time uses the model
+        self.lock = threading.RLock()
+        # Persona prefixes already run through the model, reused on every later turn
+        self.prefix_cache = PrefixCache()
+
+    def load(self):
+        """Load the tokenizer and model onto the chosen device if they aren't loaded yet."""
+        with self.lock:
+            if self.model is None:
+                self.load_model()
+
+    def load_model(self):
+        import torch
+        from transformers import AutoTokenizer, AutoModelForCausalLM
+
+        if self.device_name != 'auto':
+            device = torch.device(self.device_name)
+        elif torch.cuda.is_available():
+            device = torch.device('cuda')
+        elif torch.backends.mps.is_available():
+            device = torch.device('mps')
+        else:
+            device = torch.device('cpu')
+
+        tokenizer = AutoTokenizer.from_pretrained(self.model_name, use_fast=False)
+        # Batched prompts are padded on the left so every row generates from its last real token
+        tokenizer.padding_side = 'left'
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        model = AutoModelForCausalLM.from_pretrained(self.model_name)
+        model.eval()
+        model.to(device)
+
+        self.device, self.tokenizer, self.model = device, tokenizer, model
+
+    def generate(self, prompt: str, max_new_tokens: int = LLM_MAX_NEW_TOKENS, temperature: float = LLM_TEMPERATURE,
+                 cancel_event: threading.Event = None, prefix: str = None, on_text=None) -> str:
+        import torch
+
+        self.load()
+        tokenizer = self.tokenizer
+
+        with self.lock:
+            # Tokenize the prompt, reusing the cached key/values of its prefix when there is one
+            inputs, past_key_values = self.prepare_inputs(prompt, prefix)
+
+            # Generate the response
+            with torch.no_grad():
+                outputs = self.model.generate(
+                    **inputs,
+                    past_key_values=past_key_values,
+                    max_new_tokens=max_new_tokens,
+                    pad_token_id=tokenizer.eos_token_id,
+                    do_sample=True,
+                    temperature=temperature,
+                    stopping_criteria=cancel_criteria(cancel_event) if cancel_event is not None else None,
+                    streamer=text_streamer(tokenizer, [on_text]) if on_text is not None else None
+                )
+        # Decode only the newly generated tokens
+        return tokenizer.decode(outputs[0][inputs['input_ids'].shape[1]:], skip_special_tokens=True).strip()
+
+    def count_tokens(self, text: str) -> int:
+        """Count tokens with the model's tokenizer once it is loaded, estimating until then."""
+        if self.tokenizer is None:
+            return super().count_tokens(text)
+        return len(self.tokenizer(text, add_special_tokens=False).input_ids)
+
+    def token_counter(self):
+        return self.tokenizer
+
+    def prepare_inputs(self, prompt: str, prefix: str = None):
+        """Return (model inputs, cached past key/values or None) for a single prompt.
+
+        A prefix is tokenized on its own and run through the model once; later
+        prompts with the same prefix only need their remaining tokens processed.
+        """
+        import torch
+
+        tokenizer = self.tokenizer
+        if not prefix or not prompt.startswith(prefix):
+            inputs = tokenizer(prompt, return_tensors='pt', truncation=True, max_length=LLM_MAX_LENGTH)
+            return {k: v.to(self.device) for k, v in inputs.items()}, None
+
+        prefix_ids, past_key_values = self.cached_prefix(prefix)
+
+        suffix_ids = tokenizer(prompt[len(prefix):], return_tensors='pt', add_special_tokens=False).input_ids.to(self.device)
+        input_ids = torch.cat([prefix_ids, suffix_ids], dim=1)
+        if input_ids.shape[1] > LLM_MAX_LENGTH or suffix_ids.shape[1] == 0:
+            # Too long to keep the prefix intact (or nothing after it): fall back to a plain prompt
+            return self.prepare_inputs(prompt)
+        return {'input_ids': input_ids, 'attention_mask': torch.ones_like(input_ids)}, past_key_values
+
+    def cached_prefix(self, prefix: str):
+        """Return (prefix token IDs, past key/values) for `prefix`, running it through the model on a cache miss."""
+        import torch
+
+        cached = self.prefix_cache.get(prefix)
+        if cached is None:
+            prefix_ids = self.tokenizer(prefix, return_tensors='pt').input_ids.to(self.device)
+            with torch.no_grad():
+                past_key_values = self.model(prefix_ids, use_cache=True).past_key_values
+            if hasattr(past_key_values, 'to_legacy_cache'):
+                past_key_values = past_key_values.to_legacy_cache()
+            # Generation builds new tensors on top of these, so the cached ones are never modified
+            cached = (prefix_ids, past_key_values)
+            self.prefix_cache.put(prefix, cached)
+        return cached
+
+    def prepare_batch_inputs(self, prompts: list, prefix: str = None):
+        """Return (padded model inputs, past key/values or None) for prompts that all start with `prefix`.
+
+        The prefix's cached key/values are repeated for every row and each
+        prompt's remaining tokens follow it, left-padded and masked out, so
+        only those remaining tokens go through the model.
+        """
+        import torch
+
+        tokenizer = self.tokenizer
+        if prefix:
+            prefix_ids, past_key_values = self.cached_prefix(prefix)
+            suffixes = tokenizer([prompt[len(prefix):] for prompt in prompts], return_tensors='pt', padding=True,
+                                 add_special_tokens=False)
+            suffix_ids = suffixes.input_ids.to(self.device)
+            suffix_mask = suffixes.attention_mask.to(self.device)
+            # Like prepare_inputs, fall back to plain prompts when a row is too long or has nothing after the prefix
+            if prefix_ids.shape[1] + suffix_ids.shape[1] <= LLM_MAX_LENGTH and bool(suffix_mask.sum(dim=1).all()):
+                rows = len(prompts)
+                input_ids = torch.cat([prefix_ids.expand(rows, -1), suffix_ids], dim=1)
+                attention_mask = torch.cat([torch.ones_like(prefix_ids).expand(rows, -1), suffix_mask], dim=1)
+                past_key_values = tuple(tuple(tensor.expand(rows, *tensor.shape[1:]).contiguous() for tensor in layer)
+                                        for layer in past_key_values)
+                return {'input_ids': input_ids, 'attention_mask': attention_mask}, past_key_values
+
+        inputs = tokenizer(prompts, return_tensors='pt', padding=True, truncation=True, max_length=LLM_MAX_LENGTH)
+        return {k: v.to(self.device) for k, v in inputs.items()}, None
+
+    def generate_batch(self, prompts: list, max_new_tokens: int = LLM_MAX_NEW_TOKENS, temperature: float = LLM_TEMPERATURE,
+                       cancel_events: list = None, prefixes: list = None, text_callbacks: list = None) -> list:
+        """Run the prompts through the model as padded batches.
+
+        Prompts that share a prefix with another prompt in the batch (the same
+        NPC persona) run together on its cached key/values; all the others
+        share one plain padded batch. Only a batch of a single prompt goes
+        through `generate`.
+        """
+        count = len(prompts)
+        cancel_events = cancel_events or [None] * count
+        prefixes = prefixes or [None] * count
+        text_callbacks = text_callbacks or [None] * count
+        if count == 1:
+            return [self.generate(prompts[0], max_new_tokens, temperature, cancel_events[0], prefixes[0],
+                                  text_callbacks[0])]
+
+        groups = {}
+        for row, (prompt, prefix) in enumerate(zip(prompts, prefixes)):
+            if prefix and prompt.startswith(prefix):
+                groups.setdefault(prefix, []).append(row)
+        batches = [(prefix, rows) for prefix, rows in groups.items() if len(rows) >= 2]
+        shared = {row for _, rows in batches for row in rows}
+        plain = [row for row in range(count) if row not in shared]
+        if plain:
+            batches.append((None, plain))
+
+        replies = [None] * count
+        for prefix, rows in batches:
+            group_replies = self.generate_group([prompts[row] for row in rows], max_new_tokens, temperature,
+                                                [cancel_events[row] for row in rows], prefix,
+                                                [text_callbacks[row] for row in rows])
+            for row, reply in zip(rows, group_replies):
+                replies[row] = reply
+        return replies
+
+    def generate_group(self, prompts: list, max_new_tokens: int, temperature: float, cancel_events: list,
+                       prefix: str, text_callbacks: list) -> list:
+        """Run prompts that all start with `prefix` (or have none) through the model as one padded batch."""
+        import torch
+
+        self.load()
+        tokenizer = self.tokenizer
+        events = [event for event in cancel_events if event is not None]
+        with self.lock:
+            inputs, past_key_values = self.prepare_batch_inputs(prompts, prefix)
+            with torch.no_grad():
+                outputs = self.model.generate(
+                    **inputs,
+                    past_key_values=past_key_values,
+                    max_new_tokens=max_new_tokens,
+                    pad_token_id=tokenizer.pad_token_id,
+                    do_sample=True,
+                    temperature=temperature,
+                    # Stop early only when every prompt in the batch was cancelled
+                    stopping_criteria=cancel_criteria(*events) if len(events) == len(prompts) else None,
+                    streamer=text_streamer(tokenizer, text_callbacks) if any(text_callbacks) else None
+                )
+        prompt_length = inputs['input_ids'].shape[1]
+        return [tokenizer.decode(row[prompt_length:], skip_special_tokens=True).strip() for row in outputs]
+
+class StubBackend(LLMBackend):
+    """Tiny stand-in model for tests and offline play: instant, deterministic replies with no downloads."""
+    REPLIES = [
+        "Well met, traveler.",
+        "These halls twist more than you'd think.",
+        "I was just minding my own business.",
+        "Have you found anything to eat down here?",
+        "Keep your voice down, the walls have ears.",
+    ]
+
+    def generate(self, prompt: str, max_new_tokens: int = LLM_MAX_NEW_TOKENS, temperature: float = LLM_TEMPERATURE,
+                 cancel_event: threading.Event = None, prefix: str = None, on_text=None) -> str:
+        # The same prompt always gets the same reply
+        words = random.Random(prompt).choice(self.REPLIES).split()[:max_new_tokens]
+        if on_text is not None:
+            # Hand the reply out word by word, like a model generating tokens
+            for index, word in enumerate(words):
+                if cancel_event is not None and cancel_event.is_set():
+                    return ' '.join(words[:index])
+                on_text(word if index == 0 else ' ' + word)
+                time.sleep(LLM_STREAM_DELAY_MS / 1000)
+        return ' '.join(words)
+
+BACKENDS = {
+    'hf': HFBackend,
+    'stub': StubBackend,
+}
+
+_backend = None
+
+def get_backend() -> LLMBackend:
+    """Return the shared backend, creating the one named by LLM_BACKEND on first use."""
+    global _backend
+    if _backend is None:
+        if LLM_BACKEND not in BACKENDS:
+            raise ValueError(f"Unknown LLM_BACKEND {LLM_BACKEND!r}, expected one of {sorted(BACKENDS)}")
+        _backend = BACKENDS[LLM_BACKEND]()
+    return _backend
+
+def set_backend(backend: LLMBackend):
+    """Replace the shared backend, e.g. with a StubBackend in tests."""
+    global _backend, _batcher
+    _backend = backend
+    if _batcher is not None:
+        _batcher.backend = backend
+
+class BatchRequest:
+    """One prompt waiting in a BatchingQueue."""
+    def __init__(self, prompt, max_new_tokens, temperature, cancel_event, prefix, on_text):
+        self.prompt = prompt
+        self.prefix = prefix
+        self.on_text = on_text
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.cancel_event = cancel_event
+        self.future = Future()
+
+class BatchingQueue:
+    """Request queue in front of the backend that runs prompts from many NPCs as one batch.
+
+    A worker thread waits for the first prompt, keeps collecting for up to
+    `window_ms` (or until `max_batch` prompts are in), then runs them together
+    with `generate_batch` and resolves each request's future with its own reply.
+    """
+    def __init__(self, backend=None, window_ms=LLM_BATCH_WINDOW_MS, max_batch=LLM_MAX_BATCH):
+        self.backend = backend if backend is not None else get_backend()
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.requests = queue.Queue()
+        self.worker = None
+        self.lock = threading.Lock()
+
+    def submit(self, prompt: str, max_new_tokens: int = LLM_MAX_NEW_TOKENS, temperature: float = LLM_TEMPERATURE,
+               cancel_event: threading.Event = None, prefix: str = None, on_text=None) -> Future:
+        """Queue a prompt and return a Future for its generated reply."""
+        with self.lock:
+            if self.worker is None:
+                self.worker = threading.Thread(target=self.run, name='llm-batcher', daemon=True)
+                self.worker.start()
+        request = BatchRequest(prompt, max_new_tokens, temperature, cancel_event, prefix, on_text)
+        self.requests.put(request)
+        return request.future
+
+    def collect(self, batch):
+        """Block for the next request, then gather more into `batch` until the window closes or it is full."""
+        batch.append(self.requests.get())
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+    def run(self):
+        while True:
+            batch = []
+            try:
+                self.collect(batch)
+                self.run_batch(batch)
+            except Exception as error:
+                # Keep the worker alive for later requests; whatever this batch left unresolved fails
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(error)
+
+    def run_batch(self, batch):
+        """Generate replies for a collected batch and resolve every request's future."""
+        # Skip requests that were cancelled while waiting
+        pending = []
+        for request in batch:
+            if not request.future.set_running_or_notify_cancel():
+                continue
+            if request.cancel_event is not None and request.cancel_event.is_set():
+                request.future.set_result(None)
+                continue
+            pending.append(request)
+
+        # Only prompts with the same generation settings can share a batch
+        groups = {}
+        for request in pending:
+            groups.setdefault((request.max_new_tokens, request.temperature), []).append(request)
+
+        for (max_new_tokens, temperature), requests in groups.items():
+            try:
+                replies = self.backend.generate_batch(
+                    [request.prompt for request in requests], max_new_tokens, temperature,
+                    [request.cancel_event for request in requests],
+                    [request.prefix for request in requests],
+                    [request.on_text for request in requests]
+                )
+            except Exception as error:
+                for request in requests:
+                    request.future.set_exception(error)
+                continue
+            for request, reply in zip(requests, replies):
+                request.future.set_result(reply)
+            if len(replies) != len(requests):
+                error = RuntimeError(f"Backend returned {len(replies)} replies for {len(requests)} prompts")
+                for request in requests[len(replies):]:
+                    request.future.set_exception(error)
+
+_batcher = None
+
+def get_batcher() -> BatchingQueue:
+    """Return the shared BatchingQueue in front of the shared backend."""
+    global _batcher
+    if _batcher is None:
+        _batcher = BatchingQueue()
+    return _batcher
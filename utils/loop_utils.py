@@ -0,0 +1,45 @@
+import pygame
+from config import SIM_TICK_MS, MAX_FPS, IDLE_FPS, IDLE_AFTER_MS, MAX_CATCH_UP_TICKS
+
+class FrameScheduler:
+    """Paces the game loop: a capped render rate and a fixed simulation timestep.
+
+    Call `tick` once per frame. It sleeps as needed to hold the frame rate at
+    `max_fps` (or `idle_fps` once nothing has called `wake` for `idle_after_ms`)
+    and returns how many `tick_ms` simulation steps are due. Leftover time
+    carries over to the next frame, so game speed doesn't depend on the frame
+    rate; after a long stall at most `max_catch_up` steps run and the rest of
+    the backlog is dropped.
+    """
+    def __init__(self, tick_ms=SIM_TICK_MS, max_fps=MAX_FPS, idle_fps=IDLE_FPS, idle_after_ms=IDLE_AFTER_MS,
+                 max_catch_up=MAX_CATCH_UP_TICKS, clock=None):
+        self.tick_ms = tick_ms
+        self.max_fps = max_fps
+        self.idle_fps = idle_fps
+        self.idle_after_ms = idle_after_ms
+        self.max_catch_up = max_catch_up
+        self.clock = clock if clock is not None else pygame.time.Clock()
+        self.accumulator = 0  # Real time not yet simulated, in ms
+        self.idle_ms = 0  # Time since the last wake
+
+    def wake(self):
+        """Note activity (input, a streaming reply) so frames run at the full rate."""
+        self.idle_ms = 0
+
+    def idle(self):
+        return self.idle_ms >= self.idle_after_ms
+
+    def tick(self):
+        """Wait for the next frame and return the number of simulation steps to run."""
+        elapsed = self.clock.tick(self.idle_fps if self.idle() else self.max_fps)
+        self.idle_ms += elapsed
+        self.accumulator += elapsed
+
+        steps = self.accumulator // self.tick_ms
+        if steps > self.max_catch_up:
+            # Too far behind to catch up without stalling again; drop the backlog
+            steps = self.max_catch_up
+            self.accumulator = 0
+        else:
+            self.accumulator -= steps * self.tick_ms
+        return steps
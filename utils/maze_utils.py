@@ -1,8 +1,14 @@
 import pygame
 import random
-from config import GRID_SIZE, MAZE_HEIGHT, MAZE_WIDTH, WHITE, BLACK, MAZE_SEED, MIN_HALLWAY_SIZE, MAX_HALLWAY_SIZE
-from utils.display_utils import game_to_screen
-from utils.item_utils import ENTITY_IDS, Food, Drink, Tool, item_registry
+import numpy as np
+from bisect import bisect
+from itertools import accumulate
+from collections import OrderedDict
+from config import (GRID_SIZE, MAZE_HEIGHT, MAZE_WIDTH, WHITE, BLACK, MAZE_SEED, MIN_HALLWAY_SIZE, MAX_HALLWAY_SIZE,
+                    RENDER_BLOCK_SIZE, RENDER_BLOCK_CACHE)
+from utils.display_utils import game_to_screen, camera
+from utils.item_utils import Food, Drink, Tool, item_registry, item_ids_of
+from utils.visibility_utils import VisibilityIndex
 
 # Set seed for deterministic mazes
 if MAZE_SEED != -1:
@@ -11,140 +17,326 @@ if MAZE_SEED != -1:
 # Directions for maze carving (up, down, left, right)
 DIRECTIONS = [(0, -1), (0, 1), (-1, 0), (1, 0)]  # (dx, dy)
 
+# Cell values stored in the grid; anything else is an item ID
+FLOOR = 0
+WALL = 1
+GRID_DTYPE = np.uint16  # Large enough for every item ID
+
 class Maze:
-    def __init__(self):
-        """Initialize the maze object with a grid."""
-        self.grid = self.initialize_maze()
+    def __init__(self, width=MAZE_WIDTH, height=MAZE_HEIGHT, rng=random, grid=None):
+        """Initialize the maze object with a grid.
+
+        `rng` is the random source used for carving; it defaults to the global
+        `random` module so MAZE_SEED keeps producing the same mazes. An existing
+        (height, width) `grid` array, e.g. a loaded level, is used as is.
+        """
+        if grid is not None:
+            height, width = grid.shape
+        self.width = width
+        self.height = height
+        self.rng = rng
+        self.grid = grid if grid is not None else self.initialize_maze()
+        self.origin = (0, 0)  # World position of grid[0][0], used when drawing
+
+        # Pre-rendered background blocks, (bx, by) -> Surface, and the tiles that need redrawing on them
+        self.blocks = OrderedDict()
+        self.dirty_tiles = set()
+
+        # Wall prefix counts for line-of-sight checks, built on first use
+        self.visibility = None
 
     def initialize_maze(self):
-        """Initialize a grid where all cells are walls (1)."""
-        return [[1 for _ in range(MAZE_WIDTH)] for _ in range(MAZE_HEIGHT)]
+        """Initialize a (height, width) array where all cells are walls (1)."""
+        return np.full((self.height, self.width), WALL, dtype=GRID_DTYPE)
 
     def carve_passages_from(self, x, y):
-        """Recursive backtracking algorithm to carve maze paths with hallway size control."""
-        directions = DIRECTIONS[:]
-        random.shuffle(directions)
+        """Iterative backtracking algorithm to carve maze paths with hallway size control.
+
+        Uses an explicit stack instead of recursion so large mazes don't hit the
+        recursion limit. Random draws happen in the same order as the recursive
+        version, so a given seed still produces the same maze.
+        """
+        rng = self.rng
+        width, height = self.width, self.height
+        # Carve into a flat byte buffer (1 = wall) and copy it back into the grid in one step
+        walls = (self.grid == WALL)
+        cells = bytearray(walls.tobytes())
+
+        # Hallway width table, built once instead of on every step
+        widths = range(MIN_HALLWAY_SIZE, MAX_HALLWAY_SIZE + 1)
+        cum_weights = list(accumulate(MAX_HALLWAY_SIZE + 1 - w for w in widths))
+        total = cum_weights[-1] + 0.0
+        hi = len(cum_weights) - 1
+
+        # Cells covered by each (direction, hallway width) pair, relative to the current cell
+        hallway_cells = {
+            (direction, w): self.hallway_offsets(direction, w)
+            for direction in DIRECTIONS
+            for w in widths
+        }
+
+        directions = list(DIRECTIONS)
+        rng.shuffle(directions)
+        # Each frame is [x, y, shuffled directions, index of next direction]
+        stack = [[x, y, directions, 0]]
+
+        while stack:
+            frame = stack[-1]
+            cx, cy, directions, i = frame
+            if i == 4:
+                stack.pop()
+                continue
+            frame[3] = i + 1
 
-        for direction in directions:
             # Randomly choose a hallway size but keep it between the min and max limits
-            if random.random() < 0.4:
-                hallway_width = random.choices(
-                population=range(MIN_HALLWAY_SIZE, MAX_HALLWAY_SIZE + 1),
-                weights=[MAX_HALLWAY_SIZE + 1 - w for w in range(MIN_HALLWAY_SIZE, MAX_HALLWAY_SIZE + 1)],
-                k=1
-            )[0]
+            if rng.random() < 0.4:
+                # Same draw as random.choices(widths, weights, k=1)[0]
+                hallway_width = widths[bisect(cum_weights, rng.random() * total, 0, hi)]
             else:
                 hallway_width = MIN_HALLWAY_SIZE
 
-            dx, dy = direction
-            nx, ny = x + dx * 2, y + dy * 2  # Jump 2 cells to leave walls
-            if 0 <= nx < MAZE_WIDTH and 0 <= ny < MAZE_HEIGHT and self.grid[ny][nx] == 1:
+            direction = directions[i]
+            nx, ny = cx + direction[0] * 2, cy + direction[1] * 2  # Jump 2 cells to leave walls
+            if 0 <= nx < width and 0 <= ny < height and cells[ny * width + nx] == 1:
                 # Carve passage based on the hallway size
-                self.carve_hallway(x, y, direction, hallway_width)
+                for ox, oy in hallway_cells[direction, hallway_width]:
+                    wx, wy = cx + ox, cy + oy
+                    if 0 <= wx < width and 0 <= wy < height:
+                        cells[wy * width + wx] = 0
 
-                # Recursively generate next passage
-                self.carve_passages_from(nx, ny)
+                # Continue carving from the next cell
+                next_directions = list(DIRECTIONS)
+                rng.shuffle(next_directions)
+                stack.append([nx, ny, next_directions, 0])
 
-    def carve_hallway(self, x, y, direction, width):
-        """Carve a hallway of variable width based on the direction and width."""
+        carved = walls & (np.frombuffer(cells, dtype=np.uint8).reshape(height, width) == 0)
+        self.grid[carved] = FLOOR
+        self.invalidate()
+
+    def hallway_offsets(self, direction, width):
+        """Return the (dx, dy) offsets a hallway of the given direction and width covers."""
         dx, dy = direction
         steps = 2  # Number of steps to reach the next cell
         half_width = width // 2  # Since width is odd, half_width is an integer
 
+        offsets = []
         for i in range(steps + 1):  # From the current cell to the next
-            mx = x + dx * i
-            my = y + dy * i
             for w in range(-half_width, half_width + 1):
                 if dy != 0:
                     # Moving vertically; vary x to create width
-                    wx = mx + w
-                    wy = my
+                    offsets.append((dx * i + w, dy * i))
                 else:
                     # Moving horizontally; vary y to create width
-                    wx = mx
-                    wy = my + w
+                    offsets.append((dx * i, dy * i + w))
+        return offsets
+
+    def set_cell(self, x, y, value):
+        """Set a grid cell and mark its tile for redrawing.
+
+        Anything that changes the grid after generation (placing or picking up
+        items) should go through here so the cached background stays in sync.
+        """
+        was_wall = self.grid[y, x] == WALL
+        self.grid[y, x] = value
+        self.dirty_tiles.add((x, y))
+        if self.visibility is not None and was_wall != (value == WALL):
+            self.visibility.update_cell(x, y, self.grid[y, :] == WALL, self.grid[:, x] == WALL)
 
-                if 0 <= wx < MAZE_WIDTH and 0 <= wy < MAZE_HEIGHT:
-                    self.grid[wy][wx] = 0  # Carve out the hallway
+    def invalidate(self):
+        """Throw away the cached background and visibility index so they are rebuilt from the grid."""
+        self.blocks.clear()
+        self.dirty_tiles.clear()
+        self.visibility = None
 
     def generate(self):
         """Generate the maze starting from the top-left corner."""
         self.grid = self.initialize_maze()  # Reset the grid
+        self.invalidate()
         self.carve_passages_from(1, 1)
 
-    def draw(self, screen):
-        """Draw the maze on the screen."""
+    def draw(self, screen, areas=None):
+        """Draw the part of the maze inside the camera view.
+
+        The background is rendered in RENDER_BLOCK_SIZE blocks on first sight and
+        cached (least recently used blocks are dropped past RENDER_BLOCK_CACHE);
+        each frame only re-renders tiles marked dirty and blits the visible
+        blocks, so the cost follows the window size rather than the maze size.
+        With `areas` (screen rects) only those parts and the redrawn tiles are
+        blitted. Returns the screen rects that changed: the whole visible maze
+        for a full blit, otherwise the redrawn tiles and newly rendered blocks.
+        """
+        ox, oy = self.origin
+        view_x0, view_y0, view_x1, view_y1 = camera.view_cells()
+        # Visible cells in this maze's own coordinates
+        x0, y0 = max(view_x0 - ox, 0), max(view_y0 - oy, 0)
+        x1, y1 = min(view_x1 - ox, self.width), min(view_y1 - oy, self.height)
+
+        changed = []
+        size = RENDER_BLOCK_SIZE
+        for x, y in self.dirty_tiles:
+            block = self.blocks.get((x // size, y // size))
+            if block is None:
+                continue  # Picked up when the block is rendered
+            self.draw_tile(block, x, y, x // size * size, y // size * size)
+            if x0 <= x < x1 and y0 <= y < y1:
+                left, top = game_to_screen(ox + x, oy + y)
+                changed.append(pygame.Rect(left, top, GRID_SIZE, GRID_SIZE))
+        self.dirty_tiles.clear()
+
+        if x0 >= x1 or y0 >= y1:
+            return changed
+
+        # Blocks overhang the view at its edges, so every blit is clipped to it
+        left, top = game_to_screen(ox + x0, oy + y0)
+        view = pygame.Rect(left, top, (x1 - x0) * GRID_SIZE, (y1 - y0) * GRID_SIZE)
+        full = areas is None
+        areas = [view] if full else [area.clip(view) for area in list(areas) + changed]
+        for by in range(y0 // size, (y1 - 1) // size + 1):
+            for bx in range(x0 // size, (x1 - 1) // size + 1):
+                block, fresh = self.get_block(bx, by)
+                dest = pygame.Rect(game_to_screen(ox + bx * size, oy + by * size), block.get_size())
+                if fresh and not full:
+                    # Nothing of this block was on screen before; draw all of it
+                    shown = dest.clip(view)
+                    screen.blit(block, shown, shown.move(-dest.x, -dest.y))
+                    changed.append(shown)
+                    continue
+                for area in areas:
+                    clip = area.clip(dest)
+                    if clip.width and clip.height:
+                        screen.blit(block, clip, clip.move(-dest.x, -dest.y))
+
+        return [view] if full else changed
+
+    def get_block(self, bx, by):
+        """Return (surface, freshly rendered) for background block (bx, by)."""
+        block = self.blocks.get((bx, by))
+        if block is not None:
+            self.blocks.move_to_end((bx, by))
+            return block, False
+        block = self.blocks[bx, by] = self.render_block(bx, by)
+        while len(self.blocks) > RENDER_BLOCK_CACHE:
+            self.blocks.popitem(last=False)
+        return block, True
+
+    def render_block(self, bx, by):
+        """Render background block (bx, by) onto a new surface."""
+        size = RENDER_BLOCK_SIZE
+        x0, y0 = bx * size, by * size
+        x1, y1 = min(x0 + size, self.width), min(y0 + size, self.height)
+        surface = pygame.Surface(((x1 - x0) * GRID_SIZE, (y1 - y0) * GRID_SIZE))
+        surface.fill(BLACK)  # Floor
+
+        # Only walls and items need drawing on top of the floor
+        cells = self.grid[y0:y1, x0:x1]
+        ys, xs = np.nonzero(cells == WALL)
+        for x, y in zip(xs.tolist(), ys.tolist()):
+            surface.fill(WHITE, pygame.Rect(x * GRID_SIZE, y * GRID_SIZE, GRID_SIZE, GRID_SIZE))
+
+        ys, xs = np.nonzero(cells > WALL)
+        for x, y in zip(xs.tolist(), ys.tolist()):
+            self.draw_tile(surface, x0 + x, y0 + y, x0, y0)
+        return surface
+
+    def draw_tile(self, surface, x, y, x0=0, y0=0):
+        """Draw the single cell (x, y) onto a background surface whose top-left is cell (x0, y0)."""
         WALL_SCALE = 0.5  # Adjust this value between 0 and 1 to change wall size
         WALL_SIZE = GRID_SIZE * WALL_SCALE
         WALL_OFFSET = (GRID_SIZE - WALL_SIZE) / 2
-        
-        for y, row in enumerate(self.grid):
-            for x, cell in enumerate(row):
-                screen_x, screen_y = game_to_screen(x, y)
-                rect = pygame.Rect(screen_x, screen_y, GRID_SIZE, GRID_SIZE)
-                if cell == 1:
-                    # Draw walls
-                    pygame.draw.rect(screen, WHITE, rect)
-                elif cell == 0:
-                    # Draw floor
-                    pygame.draw.rect(screen, BLACK, rect)
-                elif cell in item_registry:
-                    # Draw food item
-                    item = item_registry[cell]
-                    if isinstance(item, Food):
-                        color = (255, 215, 0)  # Gold color for food
-                    elif isinstance(item, Drink):
-                        color = (30, 144, 255) # Blue color for drinks
-                    elif isinstance(item, Tool):
-                        color = (255, 0, 255) # magenta color for tools
-                        
-                        
-                    item_rect = pygame.Rect(
-                        screen_x + GRID_SIZE // 4,
-                        screen_y + GRID_SIZE // 4,
-                        GRID_SIZE // 2,
-                        GRID_SIZE // 2
-                    )
-                    pygame.draw.rect(screen, color, item_rect)  # Gold color for food
-                    
+
+        cell = int(self.grid[y, x])
+        rect = pygame.Rect((x - x0) * GRID_SIZE, (y - y0) * GRID_SIZE, GRID_SIZE, GRID_SIZE)
+        if cell == WALL:
+            # Draw walls
+            pygame.draw.rect(surface, WHITE, rect)
+            return
+
+        # Draw floor
+        pygame.draw.rect(surface, BLACK, rect)
+        item = item_registry.get(cell)
+        if item is not None:
+            # Draw item in the color of its type
+            item_rect = pygame.Rect(
+                rect.x + GRID_SIZE // 4,
+                rect.y + GRID_SIZE // 4,
+                GRID_SIZE // 2,
+                GRID_SIZE // 2
+            )
+            pygame.draw.rect(surface, item.color, item_rect)
+
     def is_wall(self, x, y):
         """Check if the given position (x, y) is a wall or out of bounds."""
         # Check if the coordinates are out of bounds (boundary check)
-        if not (0 <= x < MAZE_WIDTH and 0 <= y < MAZE_HEIGHT):
+        if not (0 <= x < self.width and 0 <= y < self.height):
             return True  # Treat out-of-bounds as a wall
 
         # Check if the cell is a wall inside the maze
-        return self.grid[y][x] == 1
+        return bool(self.grid[y, x] == WALL)
+
+    def walls_at(self, xs, ys):
+        """Vectorized is_wall: a boolean array for the cells (xs[i], ys[i]), True on walls and out of bounds."""
+        xs, ys = np.asarray(xs), np.asarray(ys)
+        inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        walls = np.ones(xs.shape, dtype=bool)
+        walls[inside] = self.grid[ys[inside], xs[inside]] == WALL
+        return walls
+
+    def clear_line(self, x0, y0, x1, y1):
+        """Check that nothing blocks sight from (x0, y0) to (x1, y1) along a row or column."""
+        if self.visibility is None:
+            self.visibility = VisibilityIndex(self)
+        return self.visibility.clear_line(x0, y0, x1, y1)
+
+    def wall_mask(self):
+        """Return a boolean (height, width) array that is True on walls."""
+        return self.grid == WALL
+
+    def open_mask(self):
+        """Return a boolean (height, width) array that is True on empty floor cells."""
+        return self.grid == FLOOR
+
+    def item_at(self, x, y):
+        """Return the item ID at (x, y), or None if there is no item there."""
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return None
+        cell = int(self.grid[y, x])
+        return cell if cell in item_registry else None
 
     def find_open_spaces(self):
         """Return a list of coordinates (x, y) that are open spaces in the maze."""
-        open_spaces = []
-        for y, row in enumerate(self.grid):
-            for x, cell in enumerate(row):
-                if cell == 0:  # 0 means open space
-                    open_spaces.append((x, y))
-        return open_spaces
-        
+        ys, xs = np.nonzero(self.open_mask())  # 0 means open space
+        return list(zip(xs.tolist(), ys.tolist()))
+
+
     def place_items(self, num_food: int = 1, num_drink: int = 1, num_tools: int = 1):
-        open_spaces = self.find_open_spaces()  # Find open spaces in the maze
-        random.shuffle(open_spaces)  # Shuffle the spaces to randomize placement
-
-        item_ids = list(ENTITY_IDS.keys())  # Get the list of item IDs
-        
-        def generate_items_by_class(cls, num_gens):
-            """Place items in the maze based on their class."""
-            i = 0
-            while i < num_gens:
-                if open_spaces:
-                    x, y = open_spaces.pop()  # Get a random open space
-                    item_id = random.choice(item_ids)  # Choose a random item ID
-                    
-                    # Check if the item class matches (Food, Drink, or Tool)
-                    if isinstance(item_registry[item_id], cls):
-                        self.grid[y][x] = item_id  # Place the item in the grid (using the ID)
-                        i += 1  # Increment the counter when an item is successfully placed
-        
-        # Generate items based on the class
-        generate_items_by_class(Food, num_food)
-        generate_items_by_class(Drink, num_drink)
-        generate_items_by_class(Tool, num_tools)
+        """Scatter the given number of food, drink and tool items over open spaces."""
+        return self.place_items_by_class({Food: num_food, Drink: num_drink, Tool: num_tools})
+
+    def place_items_by_class(self, counts):
+        """Place {item class: count} random items of each class on distinct open spaces.
+
+        Cells and item IDs are sampled in one pass, so the cost is linear in the
+        number of items. Raises ValueError if there aren't enough open spaces or
+        a class has no registered items. Returns the (x, y, item_id) placed.
+        """
+        total = sum(counts.values())
+        open_cells = np.flatnonzero(self.open_mask())
+        if total > len(open_cells):
+            raise ValueError(f"Cannot place {total} items in a maze with {len(open_cells)} open spaces")
+
+        item_ids = []
+        for cls, count in counts.items():
+            if count <= 0:
+                continue
+            ids = item_ids_of(cls)
+            if not ids:
+                raise ValueError(f"No registered items of class {cls.__name__}")
+            item_ids.extend(self.rng.choices(ids, k=count))
+
+        chosen = self.rng.sample(range(len(open_cells)), len(item_ids))
+        placed = []
+        for index, item_id in zip(chosen, item_ids):
+            y, x = divmod(int(open_cells[index]), self.width)
+            self.set_cell(x, y, item_id)  # Place the item in the grid (using the ID)
+            placed.append((x, y, item_id))
+        return placed
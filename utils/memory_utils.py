@@ -0,0 +1,117 @@
+import re
+from collections import deque
+from config import MEMORY_RECENT_TURNS, MEMORY_SUMMARY_TOKENS, MEMORY_SUMMARY_LINE_WORDS
+from utils.llm_utils import get_backend
+
+def count_tokens(text: str) -> int:
+    """Count tokens with the shared LLM backend."""
+    return get_backend().count_tokens(text)
+
+def token_counter():
+    """Identify how `count_tokens` currently counts; it changes once the model's tokenizer has loaded."""
+    return get_backend().token_counter()
+
+def compact_line(line: str, max_words=MEMORY_SUMMARY_LINE_WORDS) -> str:
+    """Shorten a history line to its first sentence, capped at `max_words` words."""
+    speaker, _, text = line.partition(': ')
+    sentence = re.split(r'(?<=[.!?])\s', text.strip(), maxsplit=1)[0]
+    words = sentence.split()
+    if len(words) > max_words:
+        sentence = ' '.join(words[:max_words]) + '...'
+    return f"{speaker}: {sentence}" if text else sentence
+
+class ConversationMemory:
+    """Bounded conversation history for one NPC.
+
+    The last `recent_turns` turns (a player line and a reply each) are kept
+    word for word in `lines`. Older lines are folded into a rolling summary of
+    shortened lines, which drops its oldest entries to stay under
+    `summary_tokens`. Token counts are worked out once per line, so building
+    a prompt costs the same on the hundredth turn as on the first. They are
+    all recounted if `token_counter` changes, e.g. from the character estimate
+    to the real tokenizer once the model loads.
+    """
+    def __init__(self, lines=None, recent_turns=MEMORY_RECENT_TURNS, summary_tokens=MEMORY_SUMMARY_TOKENS,
+                 count_tokens=count_tokens, token_counter=token_counter):
+        self.lines = lines if lines is not None else []  # Recent lines, oldest first
+        self.recent_turns = recent_turns
+        self.summary_tokens = summary_tokens
+        self.count_tokens = count_tokens
+        self.token_counter = token_counter
+        self.counted_with = token_counter()  # What the cached counts below were made with
+        self.line_tokens = [count_tokens(line) for line in self.lines]
+        self.summary = deque()  # (shortened line, tokens), oldest first
+        self.summary_token_count = 0
+        self.trim()
+
+    def add(self, line: str):
+        """Record a line of conversation, folding the oldest lines into the summary when over the limit."""
+        self.sync()
+        self.lines.append(line)
+        self.line_tokens.append(self.count_tokens(line))
+        self.trim()
+
+    def sync(self):
+        """Recount token counts if `lines` was changed directly (e.g. cleared) or the token counter changed."""
+        counter = self.token_counter()
+        if counter is not self.counted_with:
+            self.counted_with = counter
+            self.line_tokens = [self.count_tokens(line) for line in self.lines]
+            summary = [short for short, _ in self.summary]
+            self.summary.clear()
+            self.summary_token_count = 0
+            for short in summary:
+                self.add_summary(short)
+        elif len(self.line_tokens) != len(self.lines):
+            self.line_tokens = [self.count_tokens(line) for line in self.lines]
+
+    def trim(self):
+        while len(self.lines) > 2 * self.recent_turns:
+            self.fold(self.lines.pop(0))
+            self.line_tokens.pop(0)
+
+    def fold(self, line: str):
+        """Add a shortened `line` to the summary, dropping the oldest summary lines over budget."""
+        self.add_summary(compact_line(line))
+
+    def add_summary(self, short: str):
+        """Append an already shortened line to the summary, keeping it under `summary_tokens`."""
+        tokens = self.count_tokens(short)
+        self.summary.append((short, tokens))
+        self.summary_token_count += tokens
+        while self.summary and self.summary_token_count > self.summary_tokens:
+            _, dropped = self.summary.popleft()
+            self.summary_token_count -= dropped
+
+    def context(self, budget: int) -> str:
+        """Return the summary and recent lines that fit in `budget` tokens, newest lines first to go in.
+
+        Recent lines take priority; the summary is only included if it still
+        fits after them.
+        """
+        self.sync()
+        kept = []
+        used = 0
+        for line, tokens in zip(reversed(self.lines), reversed(self.line_tokens)):
+            if used + tokens + 1 > budget:  # +1 for the newline
+                break
+            kept.append(line)
+            used += tokens + 1
+        kept.reverse()
+
+        if self.summary and len(kept) == len(self.lines):
+            summary = "Earlier: " + ' '.join(short for short, _ in self.summary)
+            if used + self.summary_token_count + 3 <= budget:  # Allow for the label and newline
+                kept.insert(0, summary)
+        return '\n'.join(kept)
+
+    def tokens(self) -> int:
+        """Tokens held in the summary and recent lines together."""
+        self.sync()
+        return self.summary_token_count + sum(self.line_tokens)
+
+    def clear(self):
+        self.lines.clear()
+        self.line_tokens.clear()
+        self.summary.clear()
+        self.summary_token_count = 0
@@ -1,48 +1,68 @@
-import torch
 import pygame
 import random
-from config import GRID_SIZE
-from pydantic import BaseModel
-from utils.display_utils import game_to_screen
-from transformers import AutoTokenizer, AutoModelForCausalLM
-
-tokenizer = AutoTokenizer.from_pretrained('mlabonne/Meta-Llama-3.1-8B-Instruct-abliterated', use_fast=False)
-model = AutoModelForCausalLM.from_pretrained('mlabonne/Meta-Llama-3.1-8B-Instruct-abliterated')
-model.eval()
-
-if torch.cuda.is_available():
-    device = torch.device('cuda')
-elif torch.backends.mps.is_available():
-    device = torch.device('mps')
-    
-model.to(device)
+from concurrent.futures import Future
+from config import GRID_SIZE, NPC_PURSUIT_RANGE, NPC_SIGHT_RANGE, LLM_BATCHING, LLM_PROMPT_TOKEN_BUDGET
+from pydantic import BaseModel, PrivateAttr
+from utils.display_utils import game_to_screen, camera
+from utils.llm_utils import get_backend, get_batcher
+from utils.cache_utils import get_response_cache
+from utils.memory_utils import ConversationMemory, count_tokens
+from utils.filter_utils import content_filter
+
+def stream_hook(scanner, on_text):
+    """Return the callback to stream generation into, or None when nothing would use the stream.
+
+    The scanner only needs the stream to stop generation early, which a
+    backend like the stub can't do; otherwise streaming is only worth it for a
+    caller that shows the text as it arrives.
+    """
+    if on_text is not None or get_backend().can_stop_early:
+        return scanner.feed
+    return None
 
 class NPC(BaseModel):
     """Base NPC class with behavior, image, and color."""
     x: int
     y: int
     image_path: str
-    name :str
-    job: str
-    hobby: str
-    personality: str
-    environment: str
-    interaction_history: list = []
+    # Filled in by generate_personality_document when left empty
+    name :str = ''
+    job: str = ''
+    hobby: str = ''
+    personality: str = ''
+    environment: str = ''
+    interaction_history: list = []  # Recent lines only; older ones are summarized by the memory
     color: tuple = (0, 255, 0)  # Green by default
     move_interval: int = 10000  # Move every 10 seconds
     last_move_time: int = 0 #to track the last time an npc moved
+    _spatial_index: object = PrivateAttr(default=None)  # SpatialHash kept in sync with x/y
+    _memory: object = PrivateAttr(default=None)  # ConversationMemory over interaction_history
 
     class Config:
         arbitrary_types_allowed = True
 
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        if name in ('x', 'y') and self._spatial_index is not None:
+            self._spatial_index.move(self, self.x, self.y)
+
+    def attach_spatial_index(self, index):
+        """Register the NPC in a SpatialHash that follows every later change of x or y."""
+        self._spatial_index = index
+        index.insert(self, self.x, self.y)
+
     def draw(self, screen):
-        """Draw the NPC at the specified position."""
+        """Draw the NPC at the specified position, returning its rect, or None if it is off screen."""
+        if not camera.sees(self.x, self.y):
+            return None
         screen_x, screen_y = game_to_screen(self.x, self.y)
         rect = pygame.Rect(screen_x,screen_y, GRID_SIZE, GRID_SIZE)
         pygame.draw.rect(screen, self.color, rect)
+        return rect
 
     def __init__(self, **data):
         super().__init__(**data)
+        self._memory = ConversationMemory(self.interaction_history)
         self.generate_personality_document()
         
     def generate_personality_document(self):
@@ -73,50 +93,73 @@ class NPC(BaseModel):
         self.job = random.choice(jobs[self.environment])
         self.hobby = random.choice(hobbies[self.environment])
         
-    def can_move(self):
-        """check if the NPC can move based on the move interval"""
-        current_time = pygame.time.get_ticks()
+    def can_move(self, now=None):
+        """check if the NPC can move based on the move interval
+
+        `now` is the current time in ms; it defaults to pygame's clock so headless
+        runs can pass in a simulated time instead.
+        """
+        current_time = pygame.time.get_ticks() if now is None else now
         if current_time - self.last_move_time >= self.move_interval:
             self.last_move_time = current_time
             return True
         return False
 
-    def build_prompt(self, player_input: str) -> str:
-        prompt = (
+    def persona_prompt(self) -> str:
+        """The part of the prompt that describes this NPC; identical on every turn, so backends cache it."""
+        return (
             f"""You are {self.name},{self.job} in a {self.environment}. This environment is in a fantasy
             setting, so limit discussions to the environment, the npc's job, and the npc's hobbies. 
             The npc's personality is {self.personality}. The npc's hobbies are {self.hobby}."""
         )
+
+    def build_prompt(self, player_input: str, budget: int = LLM_PROMPT_TOKEN_BUDGET) -> str:
+        """Build the prompt for a reply to `player_input`, keeping it under `budget` tokens.
+
+        The persona comes first, then as much of the conversation memory as fits
+        in what's left of the budget, then the new turn.
+        """
+        prompt = self.persona_prompt()
+        available = budget - count_tokens(prompt) - 2  # Newlines around the history
+        turn = f"Player: {player_input}\n{self.name}:"
+        if count_tokens(turn) > available:
+            # The player's line alone is too long: keep as many of its last words as fit
+            words = player_input.split()
+            lo, hi = 0, len(words)
+            while lo < hi:
+                keep = (lo + hi + 1) // 2
+                if count_tokens(f"Player: {' '.join(words[-keep:])}\n{self.name}:") <= available:
+                    lo = keep
+                else:
+                    hi = keep - 1
+            turn = f"Player: {' '.join(words[len(words) - lo:])}\n{self.name}:"
+        remaining = available - count_tokens(turn)
+        history = self._memory.context(max(remaining, 0))
+        if history:
+            prompt = f"{prompt}\n{history}"
+        return f"{prompt}\n{turn}"
     
-    def generate_response(self, prompt: str) -> str:
-        """Generate a response using the LLM."""
-        # Tokenize the prompt
-        inputs = tokenizer(prompt, return_tensors='pt', truncation=True, max_length=1024)
-        if torch.cuda.is_available():
-            inputs = {k: v.to('cuda') for k, v in inputs.items()}
-
-        # Generate the response
-        with torch.no_grad():
-            outputs = model.generate(
-                **inputs,
-                max_new_tokens=150,
-                pad_token_id=tokenizer.eos_token_id,
-                do_sample=True,
-                temperature=0.7
-            )
-        response = tokenizer.decode(outputs[0], skip_special_tokens=True)
-        # Extract the generated response (excluding the prompt)
-        generated_response = response[len(tokenizer.decode(inputs['input_ids'][0], skip_special_tokens=True)):].strip()
-        return generated_response
+    def generate_response(self, prompt: str, cancel_event=None, on_text=None) -> str:
+        """Generate a response using the LLM backend, which loads its model on first use.
+
+        With LLM_BATCHING the prompt goes through the shared batching queue, so
+        NPCs generating at the same time share one forward pass. `on_text` gets
+        each new piece of the response while it is being generated. Generation
+        stops as soon as a banned term shows up; the cut-off response still
+        contains it, so finish_chat swaps in a fallback.
+        """
+        prefix = self.persona_prompt()
+        scanner = content_filter.scanner(cancel_event, on_text)
+        if LLM_BATCHING:
+            return get_batcher().submit(prompt, cancel_event=scanner.cancel_event, prefix=prefix,
+                                        on_text=stream_hook(scanner, on_text)).result()
+        return get_backend().generate(prompt, cancel_event=scanner.cancel_event, prefix=prefix,
+                                      on_text=stream_hook(scanner, on_text))
     
     def is_appropriate(self, response: str) -> bool:
         """Check if the response is appropriate."""
-        # Simple keyword-based filtering
-        banned_words = ['chibi', 'loli', 'shota', 'nsfw']
-        for word in banned_words:
-            if word in response.lower():
-                return False
-        return True
+        # One precompiled pattern covers every banned word
+        return content_filter.is_appropriate(response)
     
     def get_fallback_response(self) -> str:
         """Get a fallback response."""
@@ -127,18 +170,63 @@ class NPC(BaseModel):
         ]
         return random.choice(fallback_responses)
 
-    def npc_chat(self, player_input: str) -> str:
-        """Generate NPC chat using the LLM."""
-        prompt = self.build_prompt(player_input)
-        response = self.generate_response(prompt)
+    def npc_chat(self, player_input: str, cancel_event=None, on_text=None) -> str:
+        """Generate NPC chat using the LLM.
+
+        Replies to lines this NPC has answered before come from the response
+        cache without touching the model. `on_text` is passed each piece of a
+        generated reply as it streams in. If `cancel_event` gets set (the player
+        left the conversation) the reply is dropped, nothing is added to the
+        history and None is returned.
+        """
+        cache = get_response_cache()
+        cache_key = cache.key(self, player_input)
+        response = cache.get(cache_key)
+        if response is None:
+            prompt = self.build_prompt(player_input)
+            response = self.generate_response(prompt, cancel_event, on_text)
+        return self.finish_chat(player_input, response, cancel_event, cache_key)
+
+    def npc_chat_async(self, player_input: str, cancel_event=None, on_text=None) -> Future:
+        """Queue a chat turn on the batching queue without blocking; returns a Future for the reply.
+
+        Lets many NPCs talk at once (e.g. NPC-to-NPC chatter) without a thread each.
+        """
+        reply = Future()
+        cache = get_response_cache()
+        cache_key = cache.key(self, player_input)
+        response = cache.get(cache_key)
+        if response is not None:
+            reply.set_result(self.finish_chat(player_input, response, cancel_event, cache_key))
+            return reply
+
+        scanner = content_filter.scanner(cancel_event, on_text)
+        generation = get_batcher().submit(self.build_prompt(player_input), cancel_event=scanner.cancel_event,
+                                          prefix=self.persona_prompt(), on_text=stream_hook(scanner, on_text))
+
+        def deliver(done):
+            try:
+                reply.set_result(self.finish_chat(player_input, done.result(), cancel_event, cache_key))
+            except Exception as error:
+                reply.set_exception(error)
 
-        # Optionally filter the response
+        generation.add_done_callback(deliver)
+        return reply
+
+    def finish_chat(self, player_input: str, response, cancel_event=None, cache_key=None):
+        """Filter a reply, remember it under `cache_key` and record the turn in this NPC's history."""
+        if response is None or (cancel_event is not None and cancel_event.is_set()):
+            return None
+
+        # Optionally filter the response; only appropriate replies are worth caching
         if not self.is_appropriate(response):
             response = self.get_fallback_response()
+        elif cache_key is not None:
+            get_response_cache().put(cache_key, response)
 
-        # Update interaction history
-        self.interaction_history.append(f"Player: {player_input}")
-        self.interaction_history.append(f"{self.name}: {response}")
+        # Update interaction history; the memory folds old turns into its summary
+        self._memory.add(f"Player: {player_input}")
+        self._memory.add(f"{self.name}: {response}")
 
         return response
     
@@ -146,7 +234,7 @@ class StaticNPC(NPC):
     color: tuple = (0, 255, 0)
     """NPC that doesn't move."""
     
-    def update(self):
+    def update(self, maze=None, player_pos=None, now=None, flow_field=None):
         pass
 
 class RandomNPC(NPC):
@@ -156,9 +244,9 @@ class RandomNPC(NPC):
     home_y: int
     movement_range: int = 2
     
-    def update(self, maze):
+    def update(self, maze, player_pos=None, now=None, flow_field=None):
         
-        if not self.can_move():
+        if not self.can_move(now):
             return
         
         """Move randomly within a fixed range."""
@@ -175,18 +263,31 @@ class RandomNPC(NPC):
             self.x, self.y = new_x, new_y
 
 class AggressiveNPC(NPC):
-    """NPC that moves randomly until the player is within 5 squares and in line of sight."""
+    """NPC that moves randomly until the player is within 5 squares and in line of sight.
+
+    With a shared FlowField it instead chases the player along the maze whenever
+    the player is within `pursuit_range` steps of walking.
+    """
     color:tuple = (255, 0, 0)
+    pursuit_range: int = NPC_PURSUIT_RANGE
     
-    def update(self, maze, player_pos):
+    def update(self, maze, player_pos, now=None, flow_field=None):
         """Move randomly or move toward player if within range and in line of sight."""
-        if not self.can_move():
+        if not self.can_move(now):
             return
 
         directions = [(0, 1), (0, -1), (1, 0), (-1, 0)]
 
+        if flow_field is not None:
+            step = self.pursuit_step(flow_field)
+            if step is not None:
+                # Follow the field downhill toward the player
+                self.x += step[0]
+                self.y += step[1]
+                return
+
         # Check if the player is within 5 squares in line of sight
-        if self.in_line_of_sight(maze, player_pos):
+        elif self.in_line_of_sight(maze, player_pos):
             # Move toward the player
             if player_pos[0] > self.x and not maze.is_wall(self.x + 1, self.y):
                 self.x += 1
@@ -196,35 +297,32 @@ class AggressiveNPC(NPC):
                 self.y += 1
             elif player_pos[1] < self.y and not maze.is_wall(self.x, self.y - 1):
                 self.y -= 1
-        else:
-            # Move randomly
-            direction = random.choice(directions)
-            new_x = self.x + direction[0]
-            new_y = self.y + direction[1]
-
-            if not maze.is_wall(new_x, new_y):
-                self.x, self.y = new_x, new_y
+            return
+
+        # Move randomly
+        direction = random.choice(directions)
+        new_x = self.x + direction[0]
+        new_y = self.y + direction[1]
+
+        if not maze.is_wall(new_x, new_y):
+            self.x, self.y = new_x, new_y
+
+    def pursuit_step(self, flow_field):
+        """Return the flow field step toward the player if they are within pursuit range, else None."""
+        distance = flow_field.distance(self.x, self.y)
+        if distance is None or distance > self.pursuit_range:
+            return None
+        return flow_field.next_step(self.x, self.y)
                 
-    def in_line_of_sight(self, maze, player_pos, dist:int=5):
+    def in_line_of_sight(self, maze, player_pos, dist:int=NPC_SIGHT_RANGE):
         """Check if the player is within {dist} squares and there are no walls in between."""
         dx = abs(player_pos[0] - self.x)
         dy = abs(player_pos[1] - self.y)
 
-        # Check if the player is in the same row or column within 5 squares
-        if dx <= dist and dy == 0:
-            # Player is in the same row, check for walls between NPC and player
-            x_step = 1 if player_pos[0] > self.x else -1
-            for i in range(1, dx + 1):
-                if maze.is_wall(self.x + i * x_step, self.y):
-                    return False
-            return True
-        elif dy <= dist and dx == 0:
-            # Player is in the same column, check for walls between NPC and player
-            y_step = 1 if player_pos[1] > self.y else -1
-            for i in range(1, dy + 1):
-                if maze.is_wall(self.x, self.y + i * y_step):
-                    return False
-            return True
+        # Check if the player is in the same row or column within range
+        if (dx <= dist and dy == 0) or (dy <= dist and dx == 0):
+            # The maze answers wall checks along a row or column in constant time
+            return maze.clear_line(self.x, self.y, player_pos[0], player_pos[1])
 
         # If the player is not in the same row/column within range
         return False
\ No newline at end of file
@@ -0,0 +1,155 @@
+from collections import deque
+
+MAX_PENDING_MOVES = 64  # Deferred target moves kept before falling back to a full rebuild
+
+class FlowField:
+    """Shared BFS distance map from a target cell (the player) over the open cells of a maze.
+
+    One field serves every pursuing NPC: `distance` and `next_step` are O(1)
+    lookups, so the per-tick cost doesn't grow with the number of chasers.
+
+    When the target moves to a neighbouring cell, the field is updated in place
+    instead of rebuilt. Every distance can grow by at most one, so all cells
+    start from old distance + 1 (a single global offset) and a BFS from the new
+    target only visits the cells it gets strictly closer to.
+
+    With `max_distance` set, only cells within that many steps are tracked and
+    the field is re-flooded from the target on every move, which costs
+    O(max_distance^2) no matter how big the maze is.
+    """
+    def __init__(self, maze, max_distance=None):
+        self.width = maze.width
+        self.height = maze.height
+        self.max_distance = max_distance
+        self.walkable = (~maze.wall_mask()).ravel().tolist()
+        # Distances are stored minus `offset`; None marks cells the target can't reach
+        self.stored = [None] * (self.width * self.height)
+        self.offset = 0
+        self.target = None
+        self.touched = []  # Cells set by the last bounded flood
+        self.pending = []  # Target moves not yet applied, flushed on the next lookup
+
+    def neighbours(self, i):
+        """Yield the flat indices of the walkable cells next to flat index i."""
+        width, walkable = self.width, self.walkable
+        x = i % width
+        if x > 0 and walkable[i - 1]:
+            yield i - 1
+        if x < width - 1 and walkable[i + 1]:
+            yield i + 1
+        if i >= width and walkable[i - width]:
+            yield i - width
+        if i + width < len(walkable) and walkable[i + width]:
+            yield i + width
+
+    def update(self, target):
+        """Point the field at a new target (x, y).
+
+        The work is deferred until the next lookup, so ticks where no NPC asks
+        for a step cost nothing.
+        """
+        target = tuple(target)
+        last = self.pending[-1] if self.pending else self.target
+        if target != last:
+            self.pending.append(target)
+        if len(self.pending) > MAX_PENDING_MOVES:
+            # Replaying that many shifts costs more than a rebuild
+            self.pending = self.pending[-1:]
+
+    def sync(self):
+        """Apply pending target moves, one cell at a time where possible."""
+        if not self.pending:
+            return
+        # A bounded field is re-flooded anyway, so only the latest target matters
+        targets = self.pending if self.max_distance is None else self.pending[-1:]
+        for target in targets:
+            self.retarget(target)
+        self.pending = []
+
+    def retarget(self, target):
+        """Move the field to `target`, updating incrementally when it moved one cell."""
+        if target == self.target:
+            return
+        if (self.max_distance is None and self.target is not None
+                and abs(target[0] - self.target[0]) + abs(target[1] - self.target[1]) == 1):
+            self.shift(target)
+        else:
+            self.rebuild(target)
+
+    def rebuild(self, target):
+        """Recompute the field with a BFS from `target`."""
+        x, y = target
+        if self.max_distance is None:
+            self.stored = [None] * (self.width * self.height)
+        else:
+            # Only the cells from the last flood need clearing
+            for i in self.touched:
+                self.stored[i] = None
+        self.offset = 0
+        self.target = (x, y)
+
+        start = y * self.width + x
+        if not self.walkable[start]:
+            self.touched = []
+            return
+        stored = self.stored
+        max_distance = self.max_distance
+        stored[start] = 0
+        touched = [start]
+        queue = deque([start])
+        while queue:
+            i = queue.popleft()
+            next_distance = stored[i] + 1
+            if max_distance is not None and next_distance > max_distance:
+                continue
+            for j in self.neighbours(i):
+                if stored[j] is None:
+                    stored[j] = next_distance
+                    touched.append(j)
+                    queue.append(j)
+        self.touched = touched if max_distance is not None else []
+
+    def shift(self, target):
+        """Move the target to an adjacent cell and fix up only the distances that shrink."""
+        x, y = target
+        start = y * self.width + x
+        if not self.walkable[start] or self.stored[start] is None:
+            self.rebuild(target)
+            return
+
+        # Every cell is at most one step further from the new target than from the old one
+        self.offset += 1
+        self.target = (x, y)
+
+        stored, offset = self.stored, self.offset
+        stored[start] = -offset
+        queue = deque([start])
+        while queue:
+            i = queue.popleft()
+            next_distance = stored[i] + offset + 1
+            for j in self.neighbours(i):
+                if stored[j] + offset > next_distance:
+                    stored[j] = next_distance - offset
+                    queue.append(j)
+
+    def distance(self, x, y):
+        """Return the walking distance from (x, y) to the target, or None if it can't be reached."""
+        self.sync()
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return None
+        stored = self.stored[y * self.width + x]
+        return None if stored is None else stored + self.offset
+
+    def next_step(self, x, y):
+        """Return the (dx, dy) step from (x, y) that gets closest to the target, or None if there is none."""
+        here = self.distance(x, y)
+        if here is None or here == 0:
+            return None
+
+        i = y * self.width + x
+        stored = self.stored
+        # Neighbours past max_distance were never filled in; they can't be closer anyway
+        best = min((j for j in self.neighbours(i) if stored[j] is not None), key=stored.__getitem__, default=None)
+        if best is None or self.stored[best] + self.offset >= here:
+            return None
+        return best % self.width - x, best // self.width - y
@@ -1,7 +1,8 @@
 import pygame
 from config import GRID_SIZE, HUD_HEIGHT, SCREEN_WIDTH
-from utils.item_utils import Food, Drink, Tool, ENTITY_IDS, item_registry
+from utils.item_utils import ItemStack, ITEM_IDS_BY_NAME, item_registry
 from utils.display_utils import game_to_screen
+from utils.text_utils import get_font, render_text
 
 class PlayerCharacter:
     def __init__(self, start_x, start_y, color=(0, 0, 255)):
@@ -11,12 +12,11 @@ class PlayerCharacter:
         self.color = color
         
         #Inventory
-        self.inventory = {  # Initial inventory with categories
-            "bread": Food("bread", quantity=1, nutrition_value=15),
-            "water": Drink("water", quantity=2, hydration_value=20),
-            "hammer": Tool("hammer", quantity=1)
-        }        
+        self.inventory = []  # ItemStacks in the order they were picked up
+        self.inventory_slots = {}  # Item ID -> index of its stack in `inventory`
         self.selected_item_index = 0  # Tracks the selected item in the inventory
+        for name, quantity in (("bread", 1), ("water", 2), ("hammer", 1)):  # Starting items
+            self.add_to_inventory(ITEM_IDS_BY_NAME[name], quantity)
         #Life Settings
         self.health = 100
         self.hunger = 100
@@ -35,63 +35,107 @@ class PlayerCharacter:
         screen_x, screen_y = game_to_screen(self.x, self.y)
         player_rect = pygame.Rect(screen_x, screen_y, GRID_SIZE, GRID_SIZE)
         pygame.draw.rect(screen, self.color, player_rect)
+        return player_rect
 
     def move(self, event, maze):
         """Handle player movement and check for wall collisions."""
-        new_x, new_y = self.x, self.y
+        dx, dy = 0, 0
 
         # Check for movement key presses and update position accordingly
         if event.key == pygame.K_LEFT:
-            new_x -= 1
+            dx = -1
         elif event.key == pygame.K_RIGHT:
-            new_x += 1
+            dx = 1
         elif event.key == pygame.K_UP:
-            new_y -= 1
+            dy = -1
         elif event.key == pygame.K_DOWN:
-            new_y += 1
+            dy = 1
+
+        return self.step(dx, dy, maze)
+
+    def step(self, dx, dy, maze):
+        """Move the player by (dx, dy) unless a wall is in the way. Returns True if the player moved."""
+        if dx == 0 and dy == 0:
+            return False
+
+        new_x, new_y = self.x + dx, self.y + dy
 
         # Check if the new position is a wall
-        if not maze.is_wall(new_x, new_y):
-            self.x, self.y = new_x, new_y  # Update the player's position if it's not a wall
-            
-            self.hunger -= 1
-            self.thirst -= 1
-            
-            self.hunger = max(0, self.hunger)
-            self.thirst = max(0, self.thirst)
-            
-            self.apply_hunger_thirst_effects()
+        if maze.is_wall(new_x, new_y):
+            return False
+
+        self.x, self.y = new_x, new_y  # Update the player's position if it's not a wall
 
-    def add_to_inventory(self, item):
-        """Add an item to the player's inventory."""
-        if item.name in self.inventory:
-            self.inventory[item.name].quantity += item.quantity
+        self.hunger -= 1
+        self.thirst -= 1
+
+        self.hunger = max(0, self.hunger)
+        self.thirst = max(0, self.thirst)
+
+        self.apply_hunger_thirst_effects()
+        return True
+
+    def add_to_inventory(self, item_id, quantity=1):
+        """Add `quantity` items of type `item_id` to the player's inventory."""
+        slot = self.inventory_slots.get(item_id)
+        if slot is None:
+            self.inventory_slots[item_id] = len(self.inventory)
+            self.inventory.append(ItemStack(item_id, quantity))
         else:
-            self.inventory[item.name] = item
+            self.inventory[slot].quantity += quantity
+
+    def remove_from_inventory(self, item_id, quantity=1):
+        """Remove `quantity` items of type `item_id`, dropping the stack once it is empty."""
+        slot = self.inventory_slots.get(item_id)
+        if slot is None:
+            return
+        stack = self.inventory[slot]
+        stack.quantity -= quantity
+        if stack.quantity <= 0:
+            self.drop_stack(slot)
+
+    def drop_stack(self, slot):
+        """Remove the stack at index `slot`, keeping the selection on a valid slot."""
+        del self.inventory_slots[self.inventory.pop(slot).item_id]
+        for index in range(slot, len(self.inventory)):
+            self.inventory_slots[self.inventory[index].item_id] = index
+        if self.selected_item_index >= len(self.inventory):
+            self.selected_item_index = max(len(self.inventory) - 1, 0)
 
     def get_inventory(self):
         """Return the player's inventory as a list of tuples (item name, quantity)."""
-        return [(item.name, item.quantity) for item in self.inventory.values()]
+        return [(stack.name, stack.quantity) for stack in self.inventory]
+
+    def select_item(self, step):
+        """Move the inventory selection by `step` slots, wrapping around."""
+        if self.inventory:
+            self.selected_item_index = (self.selected_item_index + step) % len(self.inventory)
+
+    def selected_stack(self):
+        """Return the selected ItemStack, or None if the inventory is empty."""
+        if self.inventory:
+            return self.inventory[self.selected_item_index]
+        return None
 
     def use_item(self):
         """Use the currently selected item."""
-        inventory_items = list(self.inventory.values())
-        if inventory_items:
-            item = inventory_items[self.selected_item_index]
-            message = item.use(self)  # Pass the player instance to the item's use method
-            self.remove_from_inventory(item.name)  # Reduce the quantity
-            return message
-        return "No item to use."
+        stack = self.selected_stack()
+        if stack is None:
+            return "No item to use."
+        message = stack.use(self)  # Pass the player instance to the item's use method
+        if stack.quantity <= 0:
+            self.drop_stack(self.selected_item_index)
+        return message
 
     def give_item(self):
         """Give the currently selected item."""
-        inventory_items = list(self.inventory.values())
-        if len(inventory_items) > 0:
-            item = inventory_items[self.selected_item_index]
-            message = item.give()  # Call the 'give' method of the item
-            self.remove_from_inventory(item.name)  # Reduce the quantity
-            return message
-        return "No item to give."
+        stack = self.selected_stack()
+        if stack is None:
+            return "No item to give."
+        message = stack.give()  # Call the 'give' method of the item
+        if stack.quantity <= 0:
+            self.drop_stack(self.selected_item_index)
+        return message
     
     def update_hunger_and_thirst(self):
         """Decrease hunger and thirst over time."""
@@ -118,19 +162,16 @@ class PlayerCharacter:
 
     def is_item_at_player_position(self, maze):
         """Check if there is an item at the player's current position."""
-        cell_value = maze.grid[self.y][self.x]
-        return cell_value in item_registry  # item_registry contains item IDs
+        return maze.item_at(self.x, self.y) is not None
 
     def pick_up_item(self, maze):
         """Pick up an item if the player is on it."""
-        cell_value = maze.grid[self.y][self.x]
-        if cell_value in item_registry:
-            item_template = item_registry[cell_value]
-            # Clone the item to avoid shared references
-            item = item_template.clone()
-            self.add_to_inventory(item)
-            maze.grid[self.y][self.x] = 0  # Remove the item from the maze
-            return f"Picked up {item.name}."
+        cell_value = maze.item_at(self.x, self.y)
+        if cell_value is not None:
+            # The maze cell already holds the item type; the inventory only needs its ID
+            self.add_to_inventory(cell_value)
+            maze.set_cell(self.x, self.y, 0)  # Remove the item from the maze
+            return f"Picked up {item_registry[cell_value].name}."
         return ""
     def check_health(self):
         """Check if the player is alive."""
@@ -139,7 +180,7 @@ class PlayerCharacter:
             # Handle player death (e.g., end game or respawn)
             
     def draw_hud(self, screen):
-        """Draw the hunger, thirst, and health HUD at the top of the screen."""
+        """Draw the hunger, thirst, and health HUD at the top of the screen, returning the HUD's rect."""
         # HUD settings
         bar_width = (SCREEN_WIDTH - 80) // 3  # Adjust spacing as needed
         bar_height = 20
@@ -172,35 +213,36 @@ class PlayerCharacter:
         # Health bar border
         pygame.draw.rect(screen, (255, 255, 255), (health_x, hud_y, bar_width, bar_height), 2)
 
-        # Fonts and labels
-        font = pygame.font.SysFont(None, 24)
+        # Fonts and labels; the font is loaded once and text only re-rendered when it changes
+        font = get_font(24, system=True)
 
         # Hunger text
-        hunger_label = font.render("Hunger", True, (255, 255, 255))
+        hunger_label = render_text(font, "Hunger", (255, 255, 255))
         hunger_label_rect = hunger_label.get_rect(center=(hunger_x + bar_width // 2, hud_y - 15))
         screen.blit(hunger_label, hunger_label_rect)
 
-        hunger_value = font.render(f"{int(self.hunger)} / {self.max_hunger}", True, (255, 255, 255))
+        hunger_value = render_text(font, f"{int(self.hunger)} / {self.max_hunger}", (255, 255, 255))
         hunger_value_rect = hunger_value.get_rect(center=(hunger_x + bar_width // 2, hud_y + bar_height + 15))
         screen.blit(hunger_value, hunger_value_rect)
 
         # Thirst text
-        thirst_label = font.render("Thirst", True, (255, 255, 255))
+        thirst_label = render_text(font, "Thirst", (255, 255, 255))
         thirst_label_rect = thirst_label.get_rect(center=(thirst_x + bar_width // 2, hud_y - 15))
         screen.blit(thirst_label, thirst_label_rect)
 
-        thirst_value = font.render(f"{int(self.thirst)} / {self.max_thirst}", True, (255, 255, 255))
+        thirst_value = render_text(font, f"{int(self.thirst)} / {self.max_thirst}", (255, 255, 255))
         thirst_value_rect = thirst_value.get_rect(center=(thirst_x + bar_width // 2, hud_y + bar_height + 15))
         screen.blit(thirst_value, thirst_value_rect)
 
         # Health text
-        health_label = font.render("Health", True, (255, 255, 255))
+        health_label = render_text(font, "Health", (255, 255, 255))
         health_label_rect = health_label.get_rect(center=(health_x + bar_width // 2, hud_y - 15))
         screen.blit(health_label, health_label_rect)
 
-        health_value = font.render(f"{int(self.health)} / {self.max_health}", True, (255, 255, 255))
+        health_value = render_text(font, f"{int(self.health)} / {self.max_health}", (255, 255, 255))
         health_value_rect = health_value.get_rect(center=(health_x + bar_width // 2, hud_y + bar_height + 15))
         screen.blit(health_value, health_value_rect)
+        return pygame.Rect(0, 0, SCREEN_WIDTH, HUD_HEIGHT)
 
     def apply_buffs(self):
         """Apply buffs when hunger and thirst are high."""
@@ -208,10 +250,3 @@ class PlayerCharacter:
             self.speed = self.max_speed  
         else:
             self.speed = self.base_speed  # Normal speed
-            
-    def get_nearby_npc(self, npcs):
-        """Return an NPC if one is adjacent to the player."""
-        for npc in npcs:
-            if abs(npc.x - self.x) + abs(npc.y - self.y) == 1:
-                return npc
-        return None
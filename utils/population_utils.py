@@ -0,0 +1,253 @@
+import pygame
+import random
+import numpy as np
+from config import GRID_SIZE, NPC_PURSUIT_RANGE, NPC_SIGHT_RANGE, SPATIAL_CELL_SIZE
+from utils.display_utils import game_to_screen, camera
+from utils.npc_utils import StaticNPC, RandomNPC, AggressiveNPC
+from utils.schedule_utils import TimerQueue
+
+# Behaviour types stored per NPC; the index into KIND_CLASSES
+STATIC, RANDOM, AGGRESSIVE = 0, 1, 2
+KIND_CLASSES = (StaticNPC, RandomNPC, AggressiveNPC)
+KIND_COLORS = [cls.model_fields['color'].default for cls in KIND_CLASSES]
+
+DIRECTION_DX = np.array([0, 0, 1, -1])
+DIRECTION_DY = np.array([1, -1, 0, 0])
+
+class NPCPopulation:
+    """Array-backed store for large numbers of NPCs.
+
+    Positions, home points, movement ranges, behaviour types and timers live in
+    numpy arrays and `update_all` moves every due NPC with a handful of array
+    operations, so thousands of wanderers cost about as much as a few. The
+    pydantic NPC objects are only built when something needs one (dialogue),
+    through `npc(index)`, and act as views of the arrays: setting a view's x or
+    y moves the NPC in the arrays, other fields are copies.
+
+    NPCs are also bucketed by `cell_size` blocks of cells, like a SpatialHash,
+    so `near` only looks at the NPCs around the query point.
+    """
+    def __init__(self, capacity=64, rng=None, cell_size=SPATIAL_CELL_SIZE):
+        self.count = 0
+        self.cell_size = cell_size
+        self.buckets = {}  # (bx, by) -> set of NPC indices
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.x = np.zeros(capacity, dtype=np.int32)
+        self.y = np.zeros(capacity, dtype=np.int32)
+        self.home_x = np.zeros(capacity, dtype=np.int32)
+        self.home_y = np.zeros(capacity, dtype=np.int32)
+        self.movement_range = np.zeros(capacity, dtype=np.int32)
+        self.pursuit_range = np.zeros(capacity, dtype=np.int32)
+        self.kind = np.zeros(capacity, dtype=np.uint8)
+        self.move_interval = np.zeros(capacity, dtype=np.int64)
+        self.last_move_time = np.zeros(capacity, dtype=np.int64)
+        self.views = {}  # index -> NPC object, built on demand
+        self.timers = TimerQueue()  # Index of every moving NPC, keyed by its next move time
+
+    def __len__(self):
+        return self.count
+
+    def grow(self):
+        """Double the capacity of every array."""
+        for name in ('x', 'y', 'home_x', 'home_y', 'movement_range', 'pursuit_range', 'kind',
+                     'move_interval', 'last_move_time'):
+            array = getattr(self, name)
+            grown = np.zeros(len(array) * 2, dtype=array.dtype)
+            grown[:len(array)] = array
+            setattr(self, name, grown)
+
+    def add(self, kind, x, y, home_x=None, home_y=None, movement_range=2, pursuit_range=NPC_PURSUIT_RANGE,
+            move_interval=10000, last_move_time=0):
+        """Add an NPC of the given kind (STATIC, RANDOM or AGGRESSIVE) and return its index."""
+        if self.count == len(self.x):
+            self.grow()
+        i = self.count
+        self.x[i], self.y[i] = x, y
+        self.home_x[i] = x if home_x is None else home_x
+        self.home_y[i] = y if home_y is None else home_y
+        self.movement_range[i] = movement_range
+        self.pursuit_range[i] = pursuit_range
+        self.kind[i] = kind
+        self.move_interval[i] = move_interval
+        self.last_move_time[i] = last_move_time
+        if kind != STATIC:
+            self.timers.schedule(last_move_time + move_interval, i)
+        self.buckets.setdefault((x // self.cell_size, y // self.cell_size), set()).add(i)
+        self.count += 1
+        return i
+
+    def add_npc(self, npc):
+        """Copy an existing NPC object into the store; the object becomes the view for its index."""
+        kind = next(kind for kind, cls in enumerate(KIND_CLASSES) if isinstance(npc, cls))
+        i = self.add(
+            kind, npc.x, npc.y,
+            home_x=getattr(npc, 'home_x', None),
+            home_y=getattr(npc, 'home_y', None),
+            movement_range=getattr(npc, 'movement_range', 0),
+            pursuit_range=getattr(npc, 'pursuit_range', 0),
+            move_interval=npc.move_interval,
+            last_move_time=npc.last_move_time,
+        )
+        self.views[i] = npc
+        npc._spatial_index = PopulationSlot(self, i)
+        return i
+
+    def npc(self, index):
+        """Return the NPC object for `index`, building it on first use, with its position brought up to date."""
+        view = self.views.get(index)
+        x, y = int(self.x[index]), int(self.y[index])
+        if view is None:
+            cls = KIND_CLASSES[self.kind[index]]
+            fields = dict(x=x, y=y, image_path='path_to_image', move_interval=int(self.move_interval[index]))
+            if cls is RandomNPC:
+                fields.update(home_x=int(self.home_x[index]), home_y=int(self.home_y[index]),
+                              movement_range=int(self.movement_range[index]))
+            elif cls is AggressiveNPC:
+                fields.update(pursuit_range=int(self.pursuit_range[index]))
+            view = self.views[index] = cls(**fields)
+            view._spatial_index = PopulationSlot(self, index)
+        if (view.x, view.y) != (x, y):
+            view.x, view.y = x, y
+        view.last_move_time = int(self.last_move_time[index])
+        return view
+
+    def place(self, i, x, y):
+        """Move NPC `i` to (x, y), keeping its bucket up to date."""
+        old_x, old_y = self.x[i:i + 1].copy(), self.y[i:i + 1].copy()
+        self.x[i], self.y[i] = x, y
+        self.rebucket(np.array([i]), old_x, old_y)
+
+    def rebucket(self, indices, old_x, old_y):
+        """Move the NPCs in `indices` that crossed into another bucket since they were at (old_x, old_y)."""
+        size = self.cell_size
+        old_bx, old_by = old_x // size, old_y // size
+        new_bx, new_by = self.x[indices] // size, self.y[indices] // size
+        for k in np.flatnonzero((old_bx != new_bx) | (old_by != new_by)).tolist():
+            i = int(indices[k])
+            old_key = (int(old_bx[k]), int(old_by[k]))
+            bucket = self.buckets[old_key]
+            bucket.discard(i)
+            if not bucket:
+                del self.buckets[old_key]
+            self.buckets.setdefault((int(new_bx[k]), int(new_by[k])), set()).add(i)
+
+    def near(self, x, y, radius=1):
+        """Return the NPCs within `radius` cells (Chebyshev) of (x, y), nearest first."""
+        size = self.cell_size
+        found = []
+        for by in range((y - radius) // size, (y + radius) // size + 1):
+            for bx in range((x - radius) // size, (x + radius) // size + 1):
+                for i in self.buckets.get((bx, by), ()):
+                    dx, dy = abs(int(self.x[i]) - x), abs(int(self.y[i]) - y)
+                    if dx <= radius and dy <= radius:
+                        found.append((dx + dy, i))
+        found.sort()
+        return [self.npc(i) for _, i in found]
+
+    def update_all(self, maze, player_pos, now, flow_field=None):
+        """Advance every NPC whose move interval has elapsed.
+
+        Due NPCs come off a timer queue, so NPCs waiting for their next move
+        cost nothing. Random walkers and aggressive NPCs too far away to notice
+        the player take one random step in vectorized form. Only aggressive NPCs close
+        enough to the player (by straight-line distance, which never exceeds the
+        walking distance) go through the per-NPC pursuit logic.
+        """
+        due = np.array(self.timers.pop_due(now), dtype=np.intp)
+        if not len(due):
+            return
+        self.last_move_time[due] = now
+        for i, interval in zip(due.tolist(), self.move_interval[due].tolist()):
+            self.timers.schedule(now + interval, i)
+
+        kind = self.kind
+        px, py = player_pos
+        wander = due
+        aggressive = due[kind[due] == AGGRESSIVE]
+        if len(aggressive):
+            reach = np.maximum(self.pursuit_range[aggressive], NPC_SIGHT_RANGE)
+            manhattan = np.abs(self.x[aggressive] - px) + np.abs(self.y[aggressive] - py)
+            pursuing = [int(i) for i in aggressive[manhattan <= reach] if self.pursue(int(i), maze, player_pos, flow_field)]
+            if pursuing:
+                wander = np.setdiff1d(due, pursuing, assume_unique=True)
+
+        self.random_steps(wander, maze)
+
+    def pursue(self, i, maze, player_pos, flow_field):
+        """Move aggressive NPC `i` toward the player like AggressiveNPC.update; False if it didn't notice them."""
+        x, y = int(self.x[i]), int(self.y[i])
+        if flow_field is not None:
+            distance = flow_field.distance(x, y)
+            if distance is None or distance > self.pursuit_range[i]:
+                return False
+            step = flow_field.next_step(x, y)
+            if step is None:
+                return False
+            self.place(i, x + step[0], y + step[1])
+            return True
+
+        dx, dy = abs(player_pos[0] - x), abs(player_pos[1] - y)
+        if not ((dx <= NPC_SIGHT_RANGE and dy == 0) or (dy <= NPC_SIGHT_RANGE and dx == 0)):
+            return False
+        if not maze.clear_line(x, y, player_pos[0], player_pos[1]):
+            return False
+        if player_pos[0] > x and not maze.is_wall(x + 1, y):
+            self.place(i, x + 1, y)
+        elif player_pos[0] < x and not maze.is_wall(x - 1, y):
+            self.place(i, x - 1, y)
+        elif player_pos[1] > y and not maze.is_wall(x, y + 1):
+            self.place(i, x, y + 1)
+        elif player_pos[1] < y and not maze.is_wall(x, y - 1):
+            self.place(i, x, y - 1)
+        return True
+
+    def random_steps(self, indices, maze):
+        """Move each NPC in `indices` one step in a random direction where the maze and its range allow."""
+        if not len(indices):
+            return
+        direction = self.rng.integers(0, 4, len(indices))
+        new_x = self.x[indices] + DIRECTION_DX[direction]
+        new_y = self.y[indices] + DIRECTION_DY[direction]
+
+        ok = ~maze.walls_at(new_x, new_y)
+        # Random walkers stay within movement_range of home; aggressive NPCs roam freely
+        bounded = self.kind[indices] == RANDOM
+        reach = self.movement_range[indices]
+        in_range = (np.abs(new_x - self.home_x[indices]) <= reach) & (np.abs(new_y - self.home_y[indices]) <= reach)
+        ok &= ~bounded | in_range
+
+        moved = indices[ok]
+        old_x, old_y = self.x[moved], self.y[moved]
+        self.x[moved] = new_x[ok]
+        self.y[moved] = new_y[ok]
+        self.rebucket(moved, old_x, old_y)
+
+    def draw(self, screen):
+        """Draw every NPC inside the camera view, returning (index, rect) for each one drawn."""
+        n = self.count
+        x0, y0, x1, y1 = camera.view_cells()
+        xs, ys = self.x[:n], self.y[:n]
+        visible = np.flatnonzero((xs >= x0) & (xs < x1) & (ys >= y0) & (ys < y1))
+        screen_x, screen_y = game_to_screen(xs[visible], ys[visible])
+        drawn = []
+        for i, left, top in zip(visible.tolist(), screen_x.tolist(), screen_y.tolist()):
+            rect = pygame.Rect(left, top, GRID_SIZE, GRID_SIZE)
+            screen.fill(KIND_COLORS[self.kind[i]], rect)
+            drawn.append((i, rect))
+        return drawn
+
+class PopulationSlot:
+    """Takes the place of a SpatialHash on an NPC view, so moving the view moves its NPC in the population."""
+    def __init__(self, population, index):
+        self.population = population
+        self.index = index
+
+    def move(self, npc, x, y):
+        self.population.place(self.index, x, y)
+
+def populate_crowd(maze, count, rng=random, population=None):
+    """Scatter `count` random-walking NPCs over distinct open cells of `maze`, returning the population."""
+    population = population if population is not None else NPCPopulation(capacity=max(count, 1))
+    for x, y in rng.sample(maze.find_open_spaces(), count):
+        population.add(RANDOM, x, y, last_move_time=rng.randrange(10000))  # Stagger their first moves
+    return population
@@ -0,0 +1,33 @@
+import heapq
+from itertools import count
+
+class TimerQueue:
+    """Priority queue of wake-up times in ms.
+
+    Things register when they next need attention and each frame pops only the
+    ones that are due, so the cost per frame follows how many wake up, not how
+    many are waiting. Times come from whatever clock the caller uses (pygame's
+    or a SimClock).
+    """
+    def __init__(self):
+        self.heap = []
+        self.order = count()  # Breaks ties so items themselves are never compared
+
+    def __len__(self):
+        return len(self.heap)
+
+    def schedule(self, when, item):
+        """Wake `item` at time `when`."""
+        heapq.heappush(self.heap, (when, next(self.order), item))
+
+    def next_time(self):
+        """Return the earliest scheduled time, or None if nothing is scheduled."""
+        return self.heap[0][0] if self.heap else None
+
+    def pop_due(self, now):
+        """Remove and return every item due at or before `now`, earliest first."""
+        heap = self.heap
+        due = []
+        while heap and heap[0][0] <= now:
+            due.append(heapq.heappop(heap)[2])
+        return due
@@ -0,0 +1,168 @@
+import random
+import numpy as np
+from config import SIM_TICK_MS, HUNGER_DECAY_INTERVAL, FLOW_FIELD_RADIUS, NUM_CROWD_NPCS
+from utils.level_utils import load_or_generate_level
+from utils.pathfinding_utils import FlowField
+from utils.spatial_utils import SpatialHash
+from utils.pc_utils import PlayerCharacter
+from utils.npc_utils import StaticNPC, RandomNPC, AggressiveNPC
+from utils.population_utils import NPCPopulation, populate_crowd
+from utils.schedule_utils import TimerQueue
+
+# Player actions accepted by Simulation.step
+MOVES = {
+    'left': (-1, 0),
+    'right': (1, 0),
+    'up': (0, -1),
+    'down': (0, 1),
+}
+PICK_UP = 'pickup'
+
+class SimClock:
+    """Millisecond clock that only moves when advanced.
+
+    Has the same `get_ticks` call as `pygame.time`, so either can drive a Simulation.
+    """
+    def __init__(self, start=0):
+        self.now = start
+
+    def get_ticks(self):
+        return self.now
+
+    def advance(self, ms):
+        self.now += ms
+
+class Simulation:
+    """Game logic without any rendering: player movement, NPC updates, hunger/thirst and item pickup.
+
+    main.py drives it with pygame's clock and keyboard events; headless runs drive
+    it with a SimClock and a list of actions, e.g.
+
+        sim = create_simulation(seed=42)
+        sim.run(['left', 'left', None, 'pickup'] * 10000)
+    """
+    def __init__(self, maze, player, npcs, clock=None, tick_ms=SIM_TICK_MS, hunger_decay_interval=HUNGER_DECAY_INTERVAL,
+                 population=None):
+        self.maze = maze
+        self.player = player
+        self.npcs = npcs
+        self.population = population  # NPCPopulation for crowds, updated in bulk
+        self.clock = clock if clock is not None else SimClock()
+        self.tick_ms = tick_ms
+        self.hunger_decay_interval = hunger_decay_interval  # ms between decay ticks, 0 disables
+        self.last_decay_time = self.clock.get_ticks()
+        self.ticks = 0
+
+        # NPC positions, kept current by the NPCs themselves as they move
+        self.npc_index = SpatialHash()
+        for npc in npcs:
+            npc.attach_spatial_index(self.npc_index)
+
+        # NPCs only get updated when their next move is due
+        self.npc_timers = TimerQueue()
+        for npc in npcs:
+            self.npc_timers.schedule(npc.last_move_time + npc.move_interval, npc)
+
+        # One distance field to the player shared by every pursuing NPC (bounded mazes only)
+        self.flow_field = FlowField(maze, FLOW_FIELD_RADIUS) if hasattr(maze, 'wall_mask') else None
+        if self.flow_field is not None and FLOW_FIELD_RADIUS is not None:
+            ranges = [npc.pursuit_range for npc in npcs if hasattr(npc, 'pursuit_range')]
+            if population is not None and len(population):
+                ranges.append(int(population.pursuit_range[:len(population)].max()))
+            if max(ranges, default=0) > FLOW_FIELD_RADIUS:
+                raise ValueError(f"NPC pursuit range {max(ranges)} is larger than FLOW_FIELD_RADIUS "
+                                 f"({FLOW_FIELD_RADIUS}); pursuers would never see the player that far away")
+
+    def move_player(self, dx, dy):
+        """Move the player by (dx, dy). Returns True if the player moved."""
+        return self.player.step(dx, dy, self.maze)
+
+    def pick_up(self):
+        """Pick up the item under the player, returning the pickup message ('' if there was none)."""
+        return self.player.pick_up_item(self.maze)
+
+    def nearby_npcs(self, radius=1):
+        """Return the NPCs within `radius` cells of the player, nearest first."""
+        nearby = self.npc_index.query_radius(self.player.x, self.player.y, radius)
+        if self.population is not None:
+            x, y = self.player.x, self.player.y
+            nearby += self.population.near(x, y, radius)
+            nearby.sort(key=lambda npc: abs(npc.x - x) + abs(npc.y - y))
+        return nearby
+
+    def update(self, now=None):
+        """Advance everything that runs on the clock: NPC movement and hunger/thirst decay."""
+        if now is None:
+            now = self.clock.get_ticks()
+
+        player_pos = (self.player.x, self.player.y)
+        if self.flow_field is not None:
+            self.flow_field.update(player_pos)
+        for npc in self.npc_timers.pop_due(now):
+            npc.update(self.maze, player_pos, now, self.flow_field)
+            # NPCs that don't move (StaticNPC) leave last_move_time alone; check again an interval later
+            next_move = npc.last_move_time + npc.move_interval
+            self.npc_timers.schedule(next_move if next_move > now else now + npc.move_interval, npc)
+        if self.population is not None:
+            self.population.update_all(self.maze, player_pos, now, self.flow_field)
+
+        if self.hunger_decay_interval and now - self.last_decay_time >= self.hunger_decay_interval:
+            self.last_decay_time = now
+            self.player.update_hunger_and_thirst()
+            self.player.check_health()
+
+    def step(self, action=None):
+        """Apply one player action ('left', 'right', 'up', 'down', 'pickup' or None) and advance one tick."""
+        if action == PICK_UP:
+            self.pick_up()
+        elif action in MOVES:
+            self.move_player(*MOVES[action])
+
+        if isinstance(self.clock, SimClock):
+            self.clock.advance(self.tick_ms)
+        self.update()
+        self.ticks += 1
+
+    def run(self, actions):
+        """Step through an iterable of actions, one per tick. Returns the number of ticks run."""
+        start = self.ticks
+        for action in actions:
+            self.step(action)
+        return self.ticks - start
+
+def build_simulation(maze, spawns, clock=None, num_crowd=NUM_CROWD_NPCS, seed=-1):
+    """Put the player and the standard NPCs on a level's {kind: (x, y)} spawn points and return its Simulation.
+
+    `num_crowd` extra wandering NPCs are added through an NPCPopulation,
+    scattered from `seed` (-1 for the global random state).
+    """
+    player = PlayerCharacter(*spawns['player'])
+
+    static_npc = StaticNPC(x=0, y=0, image_path='path_to_image')
+    static_npc.x, static_npc.y = spawns['static_npc']
+
+    random_npc = RandomNPC(x=0, y=0, home_x=0, home_y=0, image_path='path_to_image')
+    random_npc.x, random_npc.y = spawns['random_npc']
+    random_npc.home_x, random_npc.home_y = random_npc.x, random_npc.y
+
+    aggressive_npc = AggressiveNPC(x=0, y=0, image_path='path_to_image')
+    aggressive_npc.x, aggressive_npc.y = spawns['aggressive_npc']
+
+    population = None
+    if num_crowd:
+        population = NPCPopulation(capacity=num_crowd, rng=np.random.default_rng(seed if seed != -1 else None))
+        populate_crowd(maze, num_crowd, random.Random(seed) if seed != -1 else random, population)
+    return Simulation(maze, player, [static_npc, random_npc, aggressive_npc], clock=clock, population=population)
+
+def create_simulation(seed=-1, clock=None, num_crowd=NUM_CROWD_NPCS, cache_dir=None, **level_settings):
+    """Build a Simulation on a level generated from `seed` with the standard player and NPC spawns.
+
+    The same seed gives the same level in every run. Levels are only written to
+    (and read from) the level cache when a `cache_dir` is given. `num_crowd`
+    extra wandering NPCs are added through an NPCPopulation.
+    """
+    maze, spawns = load_or_generate_level(seed, cache_dir=cache_dir, **level_settings)
+    if seed != -1:
+        # NPC personas and random walks draw from the global random state, like MAZE_SEED seeds it
+        random.seed(seed)
+    return build_simulation(maze, spawns, clock, num_crowd, seed)
@@ -0,0 +1,76 @@
+from config import SPATIAL_CELL_SIZE
+
+class SpatialHash:
+    """Uniform grid index over entity positions for proximity queries.
+
+    Entities are bucketed by the `cell_size` x `cell_size` block of maze cells
+    they stand in, so a query only looks at the few buckets it overlaps instead
+    of every entity. Entities don't need to be hashable; they are keyed by id().
+    """
+    def __init__(self, cell_size=SPATIAL_CELL_SIZE):
+        self.cell_size = cell_size
+        self.buckets = {}  # (bx, by) -> {id(entity): entity}
+        self.positions = {}  # id(entity) -> (x, y)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def bucket_key(self, x, y):
+        return x // self.cell_size, y // self.cell_size
+
+    def insert(self, entity, x, y):
+        """Add an entity at (x, y), or move it there if it is already indexed."""
+        key = id(entity)
+        if key in self.positions:
+            self.move(entity, x, y)
+            return
+        self.positions[key] = (x, y)
+        self.buckets.setdefault(self.bucket_key(x, y), {})[key] = entity
+
+    def remove(self, entity):
+        """Remove an entity from the index; does nothing if it isn't indexed."""
+        key = id(entity)
+        position = self.positions.pop(key, None)
+        if position is None:
+            return
+        bucket_key = self.bucket_key(*position)
+        bucket = self.buckets[bucket_key]
+        del bucket[key]
+        if not bucket:
+            del self.buckets[bucket_key]
+
+    def move(self, entity, x, y):
+        """Update an indexed entity's position."""
+        key = id(entity)
+        old = self.positions.get(key)
+        if old is None:
+            self.insert(entity, x, y)
+            return
+        self.positions[key] = (x, y)
+
+        old_bucket, new_bucket = self.bucket_key(*old), self.bucket_key(x, y)
+        if old_bucket != new_bucket:
+            bucket = self.buckets[old_bucket]
+            del bucket[key]
+            if not bucket:
+                del self.buckets[old_bucket]
+            self.buckets.setdefault(new_bucket, {})[key] = entity
+
+    def at_cell(self, x, y):
+        """Return the entities standing exactly on (x, y)."""
+        bucket = self.buckets.get(self.bucket_key(x, y), {})
+        return [entity for key, entity in bucket.items() if self.positions[key] == (x, y)]
+
+    def query_radius(self, x, y, radius):
+        """Return the entities within `radius` cells of (x, y) on both axes, nearest first."""
+        bx0, by0 = self.bucket_key(x - radius, y - radius)
+        bx1, by1 = self.bucket_key(x + radius, y + radius)
+        found = []
+        for by in range(by0, by1 + 1):
+            for bx in range(bx0, bx1 + 1):
+                for key, entity in self.buckets.get((bx, by), {}).items():
+                    ex, ey = self.positions[key]
+                    if abs(ex - x) <= radius and abs(ey - y) <= radius:
+                        found.append((abs(ex - x) + abs(ey - y), entity))
+        found.sort(key=lambda pair: pair[0])
+        return [entity for _, entity in found]
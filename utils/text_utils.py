@@ -0,0 +1,63 @@
+import pygame
+from collections import OrderedDict
+from config import TEXT_CACHE_SIZE
+
+_fonts = {}
+
+def get_font(size, name=None, system=False):
+    """Return a shared pygame font, loading it only the first time it is asked for.
+
+    `system` fonts are looked up with pygame.font.SysFont, which searches the
+    installed fonts and is slow; the rest come from pygame.font.Font.
+    """
+    key = (name, size, system)
+    font = _fonts.get(key)
+    if font is None:
+        font = _fonts[key] = pygame.font.SysFont(name, size) if system else pygame.font.Font(name, size)
+    return font
+
+class TextCache:
+    """LRU cache of rendered text surfaces keyed by (font, text, color).
+
+    Labels that never change are rendered once; values like "42 / 100" are
+    only rendered again when the text changes.
+    """
+    def __init__(self, max_entries=TEXT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, font, text, color, antialias=True):
+        """Return the surface for `text` in `font` and `color`, rendering it on a miss."""
+        key = (font, text, tuple(color), antialias)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+        self.misses += 1
+        surface = self.surfaces[key] = font.render(text, antialias, color)
+        if len(self.surfaces) > self.max_entries:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def stats(self):
+        """Return hit/miss counters and the current size."""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': len(self.surfaces),
+        }
+
+    def clear(self):
+        self.surfaces.clear()
+        self.hits = self.misses = 0
+
+text_cache = TextCache()
+
+def render_text(font, text, color, antialias=True):
+    """Render `text` through the shared TextCache."""
+    return text_cache.render(font, text, color, antialias)
@@ -0,0 +1,56 @@
+import numpy as np
+
+class VisibilityIndex:
+    """Per-row and per-column prefix counts of walls for constant-time line-of-sight checks.
+
+    `row_walls[y, x]` is the number of walls in row y left of column x and
+    `col_walls[y, x]` the number in column x above row y, so the walls on any
+    straight horizontal or vertical segment are one subtraction away.
+    """
+    def __init__(self, maze):
+        self.width = maze.width
+        self.height = maze.height
+        walls = maze.wall_mask()
+        self.row_walls = np.zeros((self.height, self.width + 1), dtype=np.int32)
+        self.col_walls = np.zeros((self.height + 1, self.width), dtype=np.int32)
+        np.cumsum(walls, axis=1, out=self.row_walls[:, 1:])
+        np.cumsum(walls, axis=0, out=self.col_walls[1:, :])
+
+    def update_cell(self, x, y, row_walls, col_walls):
+        """Recount row y and column x after the wall state of (x, y) changed.
+
+        `row_walls` and `col_walls` are boolean wall flags for that row and
+        column, so an update costs O(width + height).
+        """
+        np.cumsum(row_walls, out=self.row_walls[y, 1:])
+        np.cumsum(col_walls, out=self.col_walls[1:, x])
+
+    def walls_in_row(self, y, x0, x1):
+        """Count the walls in row y from column x0 to x1, both inclusive."""
+        if x0 > x1:
+            x0, x1 = x1, x0
+        return int(self.row_walls[y, x1 + 1] - self.row_walls[y, x0])
+
+    def walls_in_column(self, x, y0, y1):
+        """Count the walls in column x from row y0 to y1, both inclusive."""
+        if y0 > y1:
+            y0, y1 = y1, y0
+        return int(self.col_walls[y1 + 1, x] - self.col_walls[y0, x])
+
+    def clear_line(self, x0, y0, x1, y1):
+        """Check that no cell after (x0, y0) up to and including (x1, y1) is a wall.
+
+        Only straight row or column segments inside the maze are supported;
+        anything else is reported as blocked.
+        """
+        if not (0 <= x0 < self.width and 0 <= x1 < self.width and 0 <= y0 < self.height and 0 <= y1 < self.height):
+            return False
+        if y0 == y1:
+            if x0 == x1:
+                return True
+            step = 1 if x1 > x0 else -1
+            return self.walls_in_row(y0, x0 + step, x1) == 0
+        if x0 == x1:
+            step = 1 if y1 > y0 else -1
+            return self.walls_in_column(x0, y0 + step, y1) == 0
+        return False